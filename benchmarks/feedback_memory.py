@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+ Measures the memory the grader needs for the feedback of large test files.
+
+ For every --size, a test case with input and answer files of that many MiB
+ is generated and its feedback rendered in a fresh interpreter, once
+ reading the files whole and truncating them afterwards (full) and once
+ with the bounded reads of read_file (bounded). The growth of the
+ interpreter's peak RSS and the time taken are printed as one JSON object
+ per line. With bounded reads the growth should not depend on the size.
+
+ Examples:
+    $ python3 benchmarks/feedback_memory.py
+    $ python3 benchmarks/feedback_memory.py --size 1 --size 50 --size 200
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPOSITORY = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY))
+
+METHODS = ["full", "bounded"]
+MEBIBYTE = 1024 * 1024
+LINE = b"1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16 17 18 19 20 21 22 23 24 25 26 27\n"
+
+
+def parse_args() -> argparse.Namespace:
+    argsparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argsparser.add_argument(
+        "--size",
+        type=int,
+        action="append",
+        help="size of the input and answer files in MiB, can be repeated "
+        "(default 1, 10, 100 and 200)",
+    )
+    # Internal, renders the feedback of a generated test case and reports
+    argsparser.add_argument("--child", nargs=2, metavar=("METHOD", "TEST"))
+    return argsparser.parse_args()
+
+
+def generate(test: Path, size):
+    lines = size * MEBIBYTE // len(LINE)
+    for suffix in [".in", ".ans"]:
+        with open(test.with_suffix(suffix), "wb") as f:
+            for _ in range(lines):
+                f.write(LINE)
+    test.with_name("output").write_bytes(LINE)
+
+
+def read_whole_file(path, max_length=None):
+    """read_file before feedback was built from bounded reads."""
+    if not path.exists():
+        return None
+    with open(path, errors="replace") as f:
+        return f.read()
+
+
+def child(method, test: Path):
+    import grader
+
+    if method == "full":
+        grader.read_file = read_whole_file
+    feedback = grader.Feedback(test, test.with_name("output"))
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    message = feedback.render(True)
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        json.dumps(
+            {
+                "rss_growth_kib": after - before,
+                "seconds": round(elapsed, 4),
+                "message_length": len(message),
+            }
+        )
+    )
+
+
+def main():
+    args = parse_args()
+    if args.child:
+        child(args.child[0], Path(args.child[1]))
+        return
+    for size in args.size or [1, 10, 100, 200]:
+        with tempfile.TemporaryDirectory() as directory:
+            test = Path(directory) / "test"
+            generate(test, size)
+            for method in METHODS:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--child", method, str(test)],
+                    check=True,
+                    stdout=subprocess.PIPE,
+                    text=True,
+                ).stdout
+                record = {"size_mib": size, "method": method}
+                record.update(json.loads(output))
+                print(json.dumps(record), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+ Measures the time and memory the grader adds on top of the submission.
+
+ A synthetic problem is generated with a configurable number of test cases,
+ depth of nested test groups and input size, and graded with a submission
+ that echoes its input. Benchmarks:
+    grade:       grade_submission end to end, in a fresh interpreter so that
+                 the grader's peak RSS can be reported. The overhead is the
+                 wall time not spent running the submission.
+    discovery:   building the manifest of the test data
+    run_testcase: run_testcase and feedback rendering of every test case
+    aggregate:   aggregate_results over the results of all test cases
+    feedback:    get_feedback_message with input, output and answer of the
+                 configured size
+
+ Every benchmark prints one JSON object per line, tagged with the commit
+ and the parameters, so that runs on different commits can be compared.
+
+ Examples:
+    $ python3 benchmarks/grader_overhead.py --tests 50 --depth 2 --size 64
+    $ python3 benchmarks/grader_overhead.py --benchmark grade --output before.jsonl
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import resource
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPOSITORY = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY))
+
+BENCHMARKS = ["grade", "discovery", "run_testcase", "aggregate", "feedback"]
+KIBIBYTE = 1024
+SUBMISSION = "import sys\nsys.stdout.write(sys.stdin.read())\n"
+# Top level test group entries, whose resource usage covers all test cases
+TOP_LEVEL_GROUP = re.compile(r"## (Sample|Secret) testcases \(")
+
+
+def parse_args() -> argparse.Namespace:
+    argsparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argsparser.add_argument(
+        "--benchmark",
+        choices=BENCHMARKS,
+        action="append",
+        help="benchmark to run, can be repeated (default all)",
+    )
+    argsparser.add_argument(
+        "--tests",
+        type=int,
+        default=20,
+        help="test cases in every leaf test group (default 20)",
+    )
+    argsparser.add_argument(
+        "--depth",
+        type=int,
+        default=1,
+        help="depth of nested test groups below secret (default 1)",
+    )
+    argsparser.add_argument(
+        "--branching",
+        type=int,
+        default=2,
+        help="subgroups of every non-leaf test group (default 2)",
+    )
+    argsparser.add_argument(
+        "--size",
+        type=int,
+        default=1,
+        help="size of every input and answer file in KiB (default 1)",
+    )
+    argsparser.add_argument(
+        "--workers", type=int, default=1, help="grader workers (default 1)"
+    )
+    argsparser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="repetitions of every benchmark, the median is reported (default 3)",
+    )
+    argsparser.add_argument(
+        "--output", help="also append the results to this JSON lines file"
+    )
+    argsparser.add_argument("--directory", help=argparse.SUPPRESS)
+    return argsparser.parse_args()
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPOSITORY,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parameters(args):
+    return {
+        "tests": args.tests,
+        "depth": args.depth,
+        "branching": args.branching,
+        "size_kib": args.size,
+        "workers": args.workers,
+        "repeat": args.repeat,
+    }
+
+
+def testcase_data(size):
+    line = b"".join(b"%d " % i for i in range(100)) + b"\n"
+    return (line * (size * KIBIBYTE // len(line) + 1))[: size * KIBIBYTE]
+
+
+def write_group(directory: Path, depth, args, data):
+    directory.mkdir(parents=True)
+    if depth == 0:
+        for i in range(1, args.tests + 1):
+            (directory / f"{i:03}.in").write_bytes(data)
+            os.link(directory / f"{i:03}.in", directory / f"{i:03}.ans")
+        return args.tests
+    return sum(
+        write_group(directory / f"group{i}", depth - 1, args, data)
+        for i in range(1, args.branching + 1)
+    )
+
+
+def write_problem(directory: Path, args):
+    """Write a synthetic problem and submission, returning the number of
+    test cases."""
+    from manifest import write_manifest
+
+    problem = directory / "problem"
+    data = testcase_data(args.size)
+    problem.mkdir()
+    (problem / "problem.yaml").write_text(
+        f"name: Synthetic\ngrader:\n  workers: {args.workers}\n"
+    )
+    (problem / ".timelimit").write_text("10\n")
+    tests = write_group(problem / "data" / "secret", args.depth, args, data)
+    sample = problem / "data" / "sample"
+    sample.mkdir()
+    for i in range(1, 3):
+        (sample / f"{i}.in").write_bytes(data)
+        os.link(sample / f"{i}.in", sample / f"{i}.ans")
+    write_manifest(problem)
+
+    submission = directory / "submission"
+    submission.mkdir()
+    (submission / "echo.py").write_text(SUBMISSION)
+    return tests + 2
+
+
+def median_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def grade_once(directory: Path):
+    """Grade the synthetic problem in this interpreter, printing one JSON
+    object with the measurements."""
+    import grader
+
+    results_path = directory / "results.json"
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        grader.grade_submission(
+            directory / "problem", directory / "submission", results_path
+        )
+        wall_time = time.perf_counter() - start
+
+    with open(results_path) as f:
+        result = json.load(f)
+    submission_time = sum(
+        test["extra_data"]["resource_usage"]["wall_time"]
+        for test in result["tests"]
+        if TOP_LEVEL_GROUP.match(test["name"]) and test.get("extra_data")
+    )
+    print(
+        json.dumps(
+            {
+                "wall_time": wall_time,
+                "submission_wall_time": submission_time,
+                "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                "results_bytes": results_path.stat().st_size,
+                "score": result["score"],
+            }
+        )
+    )
+
+
+def benchmark_grade(directory: Path, args, tests):
+    runs = []
+    for _ in range(args.repeat):
+        child = subprocess.run(
+            [sys.executable, __file__, "--directory", str(directory)],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        runs.append(json.loads(child.stdout.splitlines()[-1]))
+    assert all(run["score"] == 100.0 for run in runs), "submission was not accepted"
+    wall_time = statistics.median(run["wall_time"] for run in runs)
+    overhead = statistics.median(
+        run["wall_time"] - run["submission_wall_time"] for run in runs
+    )
+    return {
+        "testcases": tests,
+        "wall_time": wall_time,
+        "overhead": overhead,
+        "overhead_per_test": overhead / tests,
+        "peak_rss_kib": max(run["peak_rss_kib"] for run in runs),
+        "results_bytes": runs[-1]["results_bytes"],
+    }
+
+
+def benchmark_discovery(directory: Path, args, tests):
+    from manifest import build_manifest
+
+    wall_time = median_time(lambda: build_manifest(directory / "problem"), args.repeat)
+    return {"testcases": tests, "wall_time": wall_time, "per_test": wall_time / tests}
+
+
+def load_problem(directory: Path):
+    import grader
+    from manifest import load_manifest
+    from problem_config import ProblemConfig
+
+    problem = directory / "problem"
+    manifest = load_manifest(problem)
+    config = ProblemConfig(**manifest["problem"])
+    testcases = []
+    groups = [grader.load_test_group(problem, manifest["secret"], config)]
+    while groups:
+        group = groups.pop()
+        testcases.extend((group.config, testcase) for testcase in group.testcases)
+        groups.extend(subgroup for subgroup in group.subgroups if subgroup)
+    return config, testcases
+
+
+def benchmark_run_testcase(directory: Path, args, tests):
+    import grader
+    from validators import DefaultValidator
+
+    config, testcases = load_problem(directory)
+    tmpdir = tempfile.mkdtemp(dir=directory)
+    program, compile_result = grader.prepare_program(
+        config, directory / "submission", tmpdir
+    )
+    assert compile_result[0], compile_result[1]
+    validator = DefaultValidator()
+
+    overheads = []
+    wall_times = []
+    for _ in range(args.repeat):
+        for grading_config, testcase in testcases:
+            start = time.perf_counter()
+            test_result = grader.run_testcase(
+                program, validator, tmpdir, 10, config, grading_config, testcase.path
+            )
+            test_result.render_feedback()
+            wall_time = time.perf_counter() - start
+            assert test_result.verdict == grader.Verdict.AC
+            wall_times.append(wall_time)
+            overheads.append(wall_time - test_result.usage.wall_time)
+    return {
+        "testcases": len(testcases),
+        "wall_time_per_test": statistics.median(wall_times),
+        "overhead_per_test": statistics.median(overheads),
+    }
+
+
+def benchmark_aggregate(directory: Path, args, tests):
+    import grader
+    from problem_config import ProblemConfig
+
+    results = [
+        grader.TestResult(grader.Verdict.AC, 1, 0.01) for _ in range(tests)
+    ]
+    measurements = {"testcases": tests}
+    for problem_type in ("pass-fail", "scoring"):
+        grading_config = grader.TestdataConfig(
+            ProblemConfig(name="Synthetic", type=problem_type)
+        )
+        wall_time = median_time(
+            lambda: grader.aggregate_results(grading_config, results), args.repeat
+        )
+        measurements[f"wall_time_{problem_type.replace('-', '_')}"] = wall_time
+    return measurements
+
+
+def benchmark_feedback(directory: Path, args, tests):
+    import grader
+
+    data = testcase_data(args.size).decode()
+    iterations = 1000
+    wall_time = median_time(
+        lambda: [
+            grader.get_feedback_message(True, data, data, data, "judge", "team")
+            for _ in range(iterations)
+        ],
+        args.repeat,
+    )
+    return {"wall_time_per_message": wall_time / iterations}
+
+
+RUNNERS = {
+    "grade": benchmark_grade,
+    "discovery": benchmark_discovery,
+    "run_testcase": benchmark_run_testcase,
+    "aggregate": benchmark_aggregate,
+    "feedback": benchmark_feedback,
+}
+
+
+def main():
+    args = parse_args()
+    if args.directory:
+        grade_once(Path(args.directory))
+        return
+
+    commit = current_commit()
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        tests = write_problem(directory, args)
+        for benchmark in args.benchmark or BENCHMARKS:
+            record = {
+                "benchmark": benchmark,
+                "commit": commit,
+                "parameters": parameters(args),
+                **RUNNERS[benchmark](directory, args, tests),
+            }
+            line = json.dumps(record)
+            print(line, flush=True)
+            if args.output:
+                with open(args.output, "a") as f:
+                    f.write(line + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+ Measures the grader's peak memory when handing a large submission output
+ to the output validator.
+
+ Every strategy runs in a fresh interpreter so that its peak RSS can be
+ reported on its own:
+    copy:    read the output into a str, encode it to check the size and
+             send it through communicate() (how the grader used to do it)
+    fd:      check the size with stat() and pass the file as the validator's
+             stdin (how the grader does it now)
+    default: run the in-process default validator on the output
+
+ The floats case then compares --floats floats that the answer prints with
+ 6 decimals and the output with 9 under float_tolerance 1e-6, so that no
+ token is equal as a string:
+    floats:     the in-process default validator
+    floats-cpp: the C++ default validator it replaces, compiled with g++
+                (skipped without g++)
+
+ Example:
+    $ python3 benchmarks/output_handoff.py --size 100 --floats 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPOSITORY = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY))
+
+# Validator that just drains its stdin
+DRAIN_VALIDATOR = [
+    sys.executable,
+    "-c",
+    "import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open('/dev/null', 'wb'))",
+]
+MEBIBYTE = 1024 * 1024
+FLOAT_FLAGS = ["float_tolerance", "1e-6"]
+
+
+def parse_args() -> argparse.Namespace:
+    argsparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argsparser.add_argument(
+        "--size", type=int, default=100, help="output size in MiB (default 100)"
+    )
+    argsparser.add_argument(
+        "--floats",
+        type=int,
+        default=1_000_000,
+        help="number of floats of the floats case (default 1000000)",
+    )
+    argsparser.add_argument(
+        "--strategy", choices=list(STRATEGIES), help=argparse.SUPPRESS
+    )
+    argsparser.add_argument("--directory", help=argparse.SUPPRESS)
+    return argsparser.parse_args()
+
+
+def handoff_copy(directory: Path):
+    with open(directory / "output") as f:
+        output = f.read()
+    size = len(output.encode())
+    compare = subprocess.Popen(
+        DRAIN_VALIDATOR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding="utf8"
+    )
+    compare.communicate(output)
+    return size
+
+
+def handoff_fd(directory: Path):
+    size = (directory / "output").stat().st_size
+    with open(directory / "output", "rb") as output_file:
+        subprocess.run(DRAIN_VALIDATOR, stdin=output_file, stdout=subprocess.DEVNULL)
+    return size
+
+
+def handoff_default(directory: Path):
+    from validators import DefaultValidator
+
+    size = (directory / "output").stat().st_size
+    result = DefaultValidator().validate(
+        directory / "input", directory / "answer", directory / "output", directory, []
+    )
+    assert result.returncode == 42, result.judge_message
+    return size
+
+
+def handoff_floats(directory: Path):
+    from validators import DefaultValidator
+
+    size = (directory / "float_output").stat().st_size
+    result = DefaultValidator().validate(
+        directory / "input",
+        directory / "float_answer",
+        directory / "float_output",
+        directory,
+        FLOAT_FLAGS,
+    )
+    assert result.returncode == 42, result.judge_message
+    return size
+
+
+def handoff_floats_cpp(directory: Path):
+    size = (directory / "float_output").stat().st_size
+    feedback = directory / "feedback"
+    feedback.mkdir(exist_ok=True)
+    with open(directory / "float_output", "rb") as output_file:
+        returncode = subprocess.run(
+            [
+                str(directory / "default_validator"),
+                str(directory / "input"),
+                str(directory / "float_answer"),
+                str(feedback),
+                *FLOAT_FLAGS,
+            ],
+            stdin=output_file,
+        ).returncode
+    assert returncode == 42, returncode
+    return size
+
+
+STRATEGIES = {
+    "copy": handoff_copy,
+    "fd": handoff_fd,
+    "default": handoff_default,
+    "floats": handoff_floats,
+    "floats-cpp": handoff_floats_cpp,
+}
+
+
+def write_testcase(directory: Path, size):
+    line = b"".join(b"%d " % i for i in range(1000)) + b"\n"
+    with open(directory / "output", "wb") as f:
+        for _ in range(size * MEBIBYTE // len(line)):
+            f.write(line)
+    os.link(directory / "output", directory / "answer")
+    (directory / "input").touch()
+
+
+def write_float_testcase(directory: Path, floats):
+    rng = random.Random(0)
+    values = [rng.uniform(-1000, 1000) for _ in range(floats)]
+    with open(directory / "float_answer", "w") as f:
+        f.writelines("%.6f\n" % value for value in values)
+    with open(directory / "float_output", "w") as f:
+        f.writelines("%.9f\n" % value for value in values)
+
+
+def measure(strategy, directory: Path):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.monotonic()
+    size = STRATEGIES[strategy](directory)
+    wall_time = time.monotonic() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(
+        json.dumps(
+            {
+                "strategy": strategy,
+                "output_bytes": size,
+                "wall_time": wall_time,
+                "peak_rss_kib": peak_rss,
+                "peak_rss_increase_kib": peak_rss - baseline,
+            }
+        )
+    )
+
+
+def main():
+    args = parse_args()
+    if args.strategy:
+        measure(args.strategy, Path(args.directory))
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_testcase(Path(directory), args.size)
+        write_float_testcase(Path(directory), args.floats)
+        strategies = list(STRATEGIES)
+        if shutil.which("g++") is None:
+            strategies.remove("floats-cpp")
+        else:
+            subprocess.run(
+                [
+                    "g++",
+                    "-O2",
+                    "-o",
+                    str(Path(directory) / "default_validator"),
+                    str(REPOSITORY / "default_validator" / "default_validator.cpp"),
+                ],
+                check=True,
+            )
+        for strategy in strategies:
+            subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    "--strategy",
+                    strategy,
+                    "--directory",
+                    directory,
+                ],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+ Measures the startup time of a trivial program in every language of
+ languages.yaml, before and after building its warm start artifacts.
+
+ Every language gets a program printing a single line. It is compiled,
+ run --runs times as is, then its warm start artifacts are built and it is
+ run --runs times again. One JSON object with the median wall time per run
+ is printed per language. Languages whose compiler or runtime is not
+ installed are reported as skipped.
+
+ Examples:
+    $ python3 benchmarks/startup.py
+    $ python3 benchmarks/startup.py --runs 50 --language java --language python3
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+import yaml
+
+REPOSITORY = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY))
+
+# File name and source code of a program printing a single line
+PROGRAMS = {
+    "c": ("hello.c", '#include <stdio.h>\nint main(void) { puts("hello"); return 0; }\n'),
+    "cpp": ("hello.cpp", '#include <iostream>\nint main() { std::cout << "hello\\n"; }\n'),
+    "csharp": (
+        "hello.cs",
+        'class Hello { static void Main() { System.Console.WriteLine("hello"); } }\n',
+    ),
+    "fsharp": ("hello.fs", 'printfn "hello"\n'),
+    "go": ("hello.go", 'package main\nimport "fmt"\nfunc main() { fmt.Println("hello") }\n'),
+    "haskell": ("hello.hs", 'main = putStrLn "hello"\n'),
+    "java": (
+        "Hello.java",
+        "public class Hello {\n"
+        '    public static void main(String[] args) { System.out.println("hello"); }\n'
+        "}\n",
+    ),
+    "javascript": ("hello.js", 'console.log("hello");\n'),
+    "kotlin": ("hello.kt", 'fun main() { println("hello") }\n'),
+    "lisp": ("hello.lisp", '(write-line "hello")\n'),
+    "ocaml": ("hello.ml", 'print_endline "hello"\n'),
+    "pascal": ("hello.pas", "program hello;\nbegin\n  writeln('hello');\nend.\n"),
+    "php": ("hello.php", '<?php echo "hello\\n";\n'),
+    "python2_with_shebang": ("hello.py", '#!/usr/bin/env python2\nprint "hello"\n'),
+    "python3": ("hello.py", 'print("hello")\n'),
+    "python2": ("hello.py2", 'print "hello"\n'),
+    "ruby": ("hello.rb", 'puts "hello"\n'),
+    "rust": ("hello.rs", 'fn main() { println!("hello"); }\n'),
+    "scala": (
+        "Hello.scala",
+        'object Hello { def main(args: Array[String]): Unit = println("hello") }\n',
+    ),
+    "scheme": ("hello.scm", '(display "hello")\n(newline)\n'),
+}
+
+
+def parse_args() -> argparse.Namespace:
+    argsparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argsparser.add_argument(
+        "--runs", type=int, default=20, help="runs before and after (default 20)"
+    )
+    argsparser.add_argument(
+        "--language",
+        action="append",
+        help="language id to measure, can be repeated (default all)",
+    )
+    return argsparser.parse_args()
+
+
+def language_ids():
+    with open(REPOSITORY / "languages.yaml") as f:
+        return list(yaml.safe_load(f))
+
+
+def median_startup(program, directory: Path, runs):
+    from execution import run_program
+
+    wall_times = []
+    for _ in range(runs):
+        status, _, usage = run_program(
+            program,
+            outfile=str(directory / "output"),
+            errfile=str(directory / "error"),
+            timelim=60,
+            set_work_dir=True,
+        )
+        if status != 0:
+            raise RuntimeError((directory / "error").read_text(errors="replace"))
+        wall_times.append(usage.wall_time)
+    return statistics.median(wall_times)
+
+
+def measure(language_id, directory: Path, runs):
+    from grader import LANGUAGES
+    from problemtools.run import get_program
+    from warmstart import prepare_warm_start
+
+    if language_id not in PROGRAMS:
+        return {"skipped": "no sample program"}
+    filename, source = PROGRAMS[language_id]
+    source_directory = directory / "source"
+    source_directory.mkdir()
+    (source_directory / filename).write_text(source)
+
+    program = get_program(str(source_directory), LANGUAGES, str(directory))
+    if program is None or program.language.lang_id != language_id:
+        return {"skipped": "language not detected"}
+    success, message = program.compile()
+    if not success:
+        return {"skipped": (message or "compilation failed").strip().splitlines()[0]}
+
+    try:
+        before = median_startup(program, directory, runs)
+    except (OSError, RuntimeError) as error:
+        return {"skipped": str(error).strip().splitlines()[-1]}
+    if not prepare_warm_start(program, jvm=True):
+        return {"before": before, "after": None}
+    after = median_startup(program, directory, runs)
+    return {"before": before, "after": after, "speedup": before / after}
+
+
+def main():
+    args = parse_args()
+    for language_id in args.language or language_ids():
+        with tempfile.TemporaryDirectory() as directory:
+            record = {"language": language_id, "runs": args.runs}
+            record.update(measure(language_id, Path(directory), args.runs))
+            print(json.dumps(record), flush=True)
+
+
+if __name__ == "__main__":
+    main()
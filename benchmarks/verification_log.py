@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+ Measures how fast analyzetestgroups.py parses a large verifyproblem log.
+
+ A synthetic info level log of about --lines lines is generated for a
+ scoring problem with --groups secret groups, mostly test file results
+ as those dominate real logs. It is then parsed by the VerificationLogParser
+ matching every pattern against every line and printing two status lines
+ per match, as it did before (patterns), by the current one (combined) and
+ by the current one reading the log gzip compressed (gzip). Status lines go
+ to /dev/null. The time taken and the resulting time limits and number of
+ submissions are printed as one JSON object per line.
+
+ Examples:
+    $ python3 benchmarks/verification_log.py
+    $ python3 benchmarks/verification_log.py --lines 100000 --groups 3
+"""
+
+import argparse
+import contextlib
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPOSITORY = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPOSITORY / "testdata_tools"))
+
+import analyzetestgroups  # noqa: E402
+from analyzetestgroups import Problem, VerificationLogParser  # noqa: E402
+
+METHODS = ["patterns", "combined", "gzip"]
+PROBLEM_NAME = "synthetic"
+SUBMISSIONS = [
+    ("AC", "accepted", "solution.cpp"),
+    ("AC", "accepted", "solution.py"),
+    ("PAC", "partially_accepted", "greedy.cpp"),
+    ("WA", "wrong_answer", "wrong.cpp"),
+    ("TLE", "time_limit_exceeded", "brute.py"),
+]
+
+
+def parse_args() -> argparse.Namespace:
+    argsparser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    argsparser.add_argument(
+        "--lines",
+        type=int,
+        default=1_000_000,
+        help="approximate number of lines of the log (default 1000000)",
+    )
+    argsparser.add_argument(
+        "--groups",
+        type=int,
+        default=5,
+        help="number of secret test groups (default 5)",
+    )
+    return argsparser.parse_args()
+
+
+def generate(directory: Path, lines, groups):
+    """Write the problem's submissions and its log, returning the log's path."""
+    problem = directory / PROBLEM_NAME
+    for _, subdir, name in SUBMISSIONS:
+        (problem / "submissions" / subdir).mkdir(parents=True, exist_ok=True)
+        (problem / "submissions" / subdir / name).write_text("\n")
+
+    testcases = max(1, lines // (len(SUBMISSIONS) * (groups + 1)))
+    log = directory / "verifyproblem.log"
+    with open(log, "w") as f:
+        f.write(f"Loading problem {PROBLEM_NAME}\n")
+        f.write("Checking submissions\n")
+        for acr, _, name in SUBMISSIONS:
+            f.write(f"INFO : Check {acr} submission {name} (C++)\n")
+            for group in range(groups + 1):
+                data = "sample" if group == 0 else f"secret/group{group}"
+                f.write(f"INFO : Running on test case group data/{data}\n")
+                failed = acr != "AC" and group == groups
+                grade = ("WA" if acr == "PAC" else acr) if failed else "AC"
+                for case in range(testcases):
+                    testcase = f"test case {data}/{case:06}"
+                    if failed and case == testcases // 2:
+                        f.write(
+                            f"INFO : Test file result: {grade} [test case: {testcase}, "
+                            f"CPU: 0.50s @ {testcase}]\n"
+                        )
+                    else:
+                        f.write(
+                            f"INFO : Test file result: AC [CPU: 0.{case % 100:02}s "
+                            f"@ {testcase}]\n"
+                        )
+                f.write(f"INFO : Grade on test case group data/{data} is {grade}\n")
+            points = 100 if acr == "AC" else 100 * (groups - 1) // groups
+            result = "OK: AC" if acr == "AC" else f"OK: {acr}"
+            f.write(
+                f"   {acr} submission {name} (C++) {result} ({points}) "
+                f"[CPU: 0.99s @ test case secret/group1/000099]\n"
+            )
+            if acr == "AC":
+                f.write(
+                    "   Slowest AC runtime: 0.990, setting timelim to 5 secs, "
+                    "safety margin to 10 secs\n"
+                )
+    with open(log, "rb") as source, gzip.open(f"{log}.gz", "wb") as target:
+        target.writelines(source)
+    return problem, log
+
+
+def parseline_patterns(self, line):
+    """VerificationLogParser.parseline before the patterns were combined."""
+    for fun, pattern in VerificationLogParser.patterns.items():
+        match = pattern.search(line)
+        if match:
+            fun(self, match.groupdict())
+            statusline = f"Submission {self.sub}, test case {self.tc_id}"
+            print(" " * 80, end="\r")
+            print(statusline[:80], end="\r")
+
+
+def measure(method, problem: Path, log: Path):
+    parseline = VerificationLogParser.parseline
+    if method == "patterns":
+        VerificationLogParser.parseline = parseline_patterns
+    path = f"{log}.gz" if method == "gzip" else str(log)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            with analyzetestgroups.open_log(path) as inputstream:
+                result = Problem(problem, inputstream)
+            elapsed = time.perf_counter() - start
+    finally:
+        VerificationLogParser.parseline = parseline
+    return {
+        "seconds": round(elapsed, 3),
+        "submissions": len(result.submissions),
+        "groups": len(result.groups),
+        "timelimits": list(result.timelimits),
+    }
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        problem, log = generate(Path(directory), args.lines, args.groups)
+        with open(log) as f:
+            lines = sum(1 for _ in f)
+        for method in METHODS:
+            record = {"lines": lines, "method": method}
+            record.update(measure(method, problem, log))
+            print(json.dumps(record), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from pathlib import Path
+
+
+class BuildCache:
+    """Content addressed cache of compiled programs.
+
+    Programs are keyed on their source files (including any include files
+    copied next to them), their language and the language's compile command.
+    A cache entry is a copy of the program's work directory after a successful
+    compilation.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def key(self, program):
+        language = getattr(program, "language", None)
+        if language is None:
+            # Only programs built from source code with a known language
+            return None
+        digest = hashlib.sha256()
+        digest.update(language.lang_id.encode())
+        digest.update(b"\0")
+        digest.update((language.compile or "").encode())
+        digest.update(b"\0")
+        root = Path(program.path)
+        for path in sorted(root.rglob("*")):
+            if not path.is_file():
+                continue
+            digest.update(str(path.relative_to(root)).encode())
+            digest.update(b"\0")
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 16), b""):
+                    digest.update(block)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def restore(self, program, key):
+        if key is None:
+            return False
+        entry = self.directory / key
+        if not entry.is_dir():
+            return False
+        shutil.copytree(entry, program.path, symlinks=True, dirs_exist_ok=True)
+        program._compile_result = (True, None)
+        return True
+
+    def store(self, program, key):
+        if key is None:
+            return
+        entry = self.directory / key
+        if entry.exists():
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=f".{key}-", dir=self.directory))
+        try:
+            shutil.copytree(program.path, staging, symlinks=True, dirs_exist_ok=True)
+            os.rename(staging, entry)
+        except OSError:
+            # Another grader stored the same program first
+            shutil.rmtree(staging, ignore_errors=True)
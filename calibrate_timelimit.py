@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+ Determines the time limit of a problem from its accepted submissions.
+
+ Every accepted submission is run on every test case several times, in
+ parallel with every run pinned to a CPU of its own. The running time of a submission on a test case is estimated
+ robustly from its samples as the median plus three scaled median absolute
+ deviations, so that a single noisy run neither raises nor lowers the limit.
+ Like verifyproblem, the time limit is the slowest estimate multiplied by
+ the problem's time_multiplier, rounded to whole seconds.
+
+ The time limit is written to .timelimit and the per test case timings to
+ .timing_profile.json in the problem directory.
+
+ Examples:
+    $ python3 calibrate_timelimit.py problems/hello
+    $ python3 calibrate_timelimit.py problems/hello --runs 10 --workers 4
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+from pathlib import Path
+
+from grader import (
+    MEBIBYTE,
+    Verdict,
+    load_output_validator,
+    load_test_group,
+    prepare_program,
+    run_testcase,
+    run_testcases_parallel,
+)
+from manifest import TIMING_PROFILE_FILENAME, ManifestBuilder
+from problem_config import load_problem_config
+from scratch import ScratchSpace
+from slots import ExecutionSlots
+
+PROFILE_VERSION = 1
+# Limit while calibrating, the same as verifyproblem's
+CALIBRATION_TIME_LIMIT = 300
+# Scales the median absolute deviation to the standard deviation of a normal
+# distribution
+MAD_SCALE = 1.4826
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+
+    argsparser = argparse.ArgumentParser(
+        description="Determine the time limit of a problem from its accepted submissions."
+    )
+    argsparser.add_argument("problemdir", help="Path to problem directory")
+    argsparser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="Number of runs of every submission on every test case (default 5)",
+    )
+    argsparser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of runs in parallel (default: number of CPUs)",
+    )
+    return argsparser.parse_args()
+
+
+def load_testcases(problem: Path, config):
+    """Return (grading config, test case) pairs of all sample and secret test
+    cases."""
+    builder = ManifestBuilder(problem)
+    data = problem / "data"
+    data_options = {}
+    if (data / "testdata.yaml").is_file():
+        data_options = builder.load_yaml(data / "testdata.yaml")
+
+    testcases = []
+    groups = [
+        load_test_group(problem, builder.test_group(data / name, data_options), config)
+        for name in ("sample", "secret")
+    ]
+    while groups:
+        group = groups.pop(0)
+        if group is None:
+            continue
+        testcases.extend((group.config, testcase) for testcase in group.testcases)
+        groups.extend(group.subgroups)
+    return testcases
+
+
+def prepare_submissions(problem: Path, config, tmpdir):
+    submissions = {}
+    accepted = problem / "submissions" / "accepted"
+    if not accepted.is_dir():
+        sys.exit(f"FATAL: No accepted submissions in {accepted}")
+    for path in sorted(accepted.iterdir()):
+        program, compile_result = prepare_program(
+            config, path, tempfile.mkdtemp(dir=tmpdir), problem / "include"
+        )
+        if not compile_result[0]:
+            sys.exit(
+                f"FATAL: Failed to compile accepted submission {path}:\n"
+                f"{compile_result[1]}"
+            )
+        submissions[path.name] = program
+    return submissions
+
+
+def robust_estimate(samples):
+    """Return median, median absolute deviation and estimate of samples."""
+    median = statistics.median(samples)
+    mad = statistics.median(abs(sample - median) for sample in samples)
+    return median, mad, median + 3 * MAD_SCALE * mad
+
+
+def calibrate(problem: Path, runs, workers):
+    config = load_problem_config(problem / "problem.yaml")
+    tmpdir = tempfile.mkdtemp()
+    validator, compile_result = load_output_validator(problem, config, tmpdir)
+    if not compile_result[0]:
+        sys.exit(f"FATAL: Failed to compile output validator:\n{compile_result[1]}")
+    submissions = prepare_submissions(problem, config, tmpdir)
+    testcases = load_testcases(problem, config)
+
+    jobs = [
+        (submission, grading_config, testcase)
+        for _ in range(runs)
+        for submission in submissions
+        for grading_config, testcase in testcases
+    ]
+
+    # Pinned runs keep timings comparable to running one at a time
+    slots = ExecutionSlots()
+    if slots:
+        workers = min(workers, len(slots))
+    scratch = ScratchSpace(0, workers, config.limits.output * MEBIBYTE)
+
+    def run(job):
+        submission, grading_config, testcase = job
+        with scratch.directory() as working_directory, slots.acquire():
+            return run_testcase(
+                submissions[submission],
+                validator,
+                working_directory,
+                CALIBRATION_TIME_LIMIT,
+                config,
+                grading_config,
+                testcase.path,
+            )
+
+    samples = {}
+    results = run_testcases_parallel(jobs, run, workers, False)
+    for (submission, _, testcase), test_result in zip(jobs, results):
+        if test_result.verdict != Verdict.AC:
+            sys.exit(
+                f"FATAL: Accepted submission {submission} got {test_result.verdict.name} "
+                f"on {testcase.name}"
+            )
+        samples.setdefault(testcase.name, {}).setdefault(submission, []).append(
+            test_result.running_time
+        )
+    validator.close()
+    scratch.cleanup()
+
+    profile = {}
+    slowest = 0.0
+    for name, submission_samples in samples.items():
+        # The slowest accepted submission decides
+        median, mad, estimate = max(
+            (robust_estimate(times) for times in submission_samples.values()),
+            key=lambda timing: timing[2],
+        )
+        slowest = max(slowest, estimate)
+        profile[name] = {
+            "median": median,
+            "mad": mad,
+            "estimate": estimate,
+            "samples": submission_samples,
+        }
+
+    exact_time_limit = slowest * config.limits.time_multiplier
+    time_limit = max(1, int(0.5 + exact_time_limit))
+    safety_margin = max(
+        time_limit + 1, int(0.5 + exact_time_limit * config.limits.time_safety_margin)
+    )
+    return {
+        "version": PROFILE_VERSION,
+        "runs": runs,
+        "slowest_estimate": slowest,
+        "time_limit": time_limit,
+        "safety_margin": safety_margin,
+        "testcases": profile,
+    }
+
+
+def main():
+    args = parse_args()
+    problem = Path(args.problemdir)
+    profile = calibrate(problem, args.runs, max(1, args.workers))
+
+    temporary = problem / f"{TIMING_PROFILE_FILENAME}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(profile, f, indent=1)
+    os.replace(temporary, problem / TIMING_PROFILE_FILENAME)
+    with open(problem / ".timelimit", "w") as f:
+        f.write(f"{profile['time_limit']}\n")
+
+    print(
+        f"Slowest AC estimate: {profile['slowest_estimate']:.3f}, setting time limit "
+        f"to {profile['time_limit']} secs, safety margin to {profile['safety_margin']} secs"
+    )
+
+
+if __name__ == "__main__":
+    main()
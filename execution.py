@@ -0,0 +1,310 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from problemtools.run.errors import ProgramError
+from problemtools.run.limit import try_limit
+from warmstart import warm_start_command
+
+if sys.platform != "win32":
+    import resource
+
+
+class ResourceUsage:
+    """Resources used by a single run of a program."""
+
+    def __init__(
+        self,
+        peak_rss=0,
+        user_time=0.0,
+        system_time=0.0,
+        wall_time=0.0,
+        bytes_written=0,
+    ):
+        self.peak_rss: int = peak_rss  # KiB
+        self.user_time: float = user_time
+        self.system_time: float = system_time
+        self.wall_time: float = wall_time
+        self.bytes_written: int = bytes_written
+
+    @classmethod
+    def combine(cls, usages):
+        """Usage of a test group, summing up everything except the peak RSS."""
+        usages = [usage for usage in usages if usage is not None]
+        if not usages:
+            return None
+        return cls(
+            max(usage.peak_rss for usage in usages),
+            sum(usage.user_time for usage in usages),
+            sum(usage.system_time for usage in usages),
+            sum(usage.wall_time for usage in usages),
+            sum(usage.bytes_written for usage in usages),
+        )
+
+    @classmethod
+    def from_dict(cls, usage):
+        return cls(
+            usage["peak_rss_kib"],
+            usage["user_time"],
+            usage["system_time"],
+            usage["wall_time"],
+            usage["bytes_written"],
+        )
+
+    def to_dict(self):
+        return {
+            "peak_rss_kib": self.peak_rss,
+            "user_time": round(self.user_time, 4),
+            "system_time": round(self.system_time, 4),
+            "wall_time": round(self.wall_time, 4),
+            "bytes_written": self.bytes_written,
+        }
+
+
+def _kill(pid):
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def _file_size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+def _setfd(fd, filename, flag):
+    tmpfd = os.open(filename, flag)
+    os.dup2(tmpfd, fd)
+    os.close(tmpfd)
+
+
+# How long to wait for a pipe to be closed by processes left behind by the
+# program once it has exited
+DRAIN_TIMEOUT = 1.0
+
+
+class _Drain:
+    """Copies what is written to a pipe to a file, keeping only the first
+    limit bytes and discarding the rest, in a thread of its own."""
+
+    def __init__(self, fd, filename, limit):
+        self.fd = fd
+        self.limit = limit
+        self.size = 0
+        self.stopped = False
+        self.lock = threading.Lock()
+        self.file = open(filename, "wb", buffering=0)
+        self.thread = threading.Thread(target=self._copy, daemon=True)
+        self.thread.start()
+
+    def _copy(self):
+        try:
+            while True:
+                data = os.read(self.fd, 1 << 16)
+                if not data:
+                    break
+                with self.lock:
+                    if self.stopped:
+                        break
+                    if self.size < self.limit:
+                        self.file.write(data[: self.limit - self.size])
+                    self.size += len(data)
+        finally:
+            os.close(self.fd)
+            with self.lock:
+                self.file.close()
+
+    def stop(self):
+        """Stop copying once the pipe is closed, or after DRAIN_TIMEOUT
+        seconds, and return the number of bytes written to the pipe."""
+        self.thread.join(DRAIN_TIMEOUT)
+        with self.lock:
+            self.stopped = True
+            return self.size
+
+
+def run_program(
+    program,
+    infile="/dev/null",
+    outfile="/dev/null",
+    errfile="/dev/null",
+    args=None,
+    timelim=1000,
+    memlim=1024,
+    filelim=None,
+    set_work_dir=False,
+    walllim=None,
+    errlim=None,
+    cwd=None,
+):
+    """Run a problemtools program like Program.run, but also measure the
+    resources used by the process.
+
+    If filelim is given, files written by the process are limited to that many
+    bytes. If walllim is given, a watchdog kills the process once it has run
+    for that many seconds of wall time, for processes that hang without
+    using CPU time. If errlim is given, standard error is read through a pipe
+    and only its first errlim bytes are written to errfile, so that it is not
+    limited by filelim and cannot stop the process however much is written.
+    The process runs in cwd if given, and otherwise in the directory of the
+    program if set_work_dir is set.
+
+    Returns a triple (status, runtime, usage) where status is the wait status
+    of the process, runtime its user+sys time in seconds and usage its
+    ResourceUsage.
+    """
+    runcmd = program.get_runcmd(memlim=memlim)
+    if runcmd == []:
+        raise ProgramError("Could not figure out how to run %s" % program)
+    argv = warm_start_command(program, runcmd) + (args or [])
+    if program.should_skip_memory_rlimit():
+        memlim = None
+    work_dir = cwd
+    if work_dir is None and set_work_dir:
+        work_dir = getattr(program, "path", None)
+
+    if errlim is not None:
+        errpipe = os.pipe()
+    start = time.monotonic()
+    pid = os.fork()
+    if pid == 0:  # child
+        try:
+            # Reset signal dispositions that Python sets to SIG_IGN
+            for name in ("SIGPIPE", "SIGXFSZ"):
+                if hasattr(signal, name):
+                    signal.signal(getattr(signal, name), signal.SIG_DFL)
+
+            if timelim is not None:
+                try_limit(resource.RLIMIT_CPU, timelim, timelim + 1)
+            if memlim is not None:
+                try_limit(
+                    resource.RLIMIT_AS, memlim * (1024**2), resource.RLIM_INFINITY
+                )
+            try_limit(
+                resource.RLIMIT_STACK, resource.RLIM_INFINITY, resource.RLIM_INFINITY
+            )
+            if filelim is not None:
+                try_limit(resource.RLIMIT_FSIZE, filelim, filelim)
+
+            _setfd(0, infile, os.O_RDONLY)
+            _setfd(1, outfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            if errlim is None:
+                _setfd(2, errfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            else:
+                os.dup2(errpipe[1], 2)
+            if work_dir is not None:
+                os.chdir(work_dir)
+
+            os.execvp(argv[0], argv)
+        except Exception as exc:
+            print("Oops. Fatal error in child process:")
+            print(exc)
+        os.kill(os.getpid(), signal.SIGTERM)
+        os._exit(1)
+
+    drain = None
+    if errlim is not None:
+        os.close(errpipe[1])
+        drain = _Drain(errpipe[0], errfile, errlim)
+    watchdog = None
+    if walllim is not None:
+        watchdog = threading.Timer(walllim, _kill, (pid,))
+        watchdog.start()
+    _, status, rusage = os.wait4(pid, 0)
+    if watchdog is not None:
+        watchdog.cancel()
+    wall_time = time.monotonic() - start
+    error_size = _file_size(errfile) if drain is None else drain.stop()
+    runtime = rusage.ru_utime + rusage.ru_stime
+    program.runtime = max(program.runtime, runtime)
+    usage = ResourceUsage(
+        rusage.ru_maxrss,
+        rusage.ru_utime,
+        rusage.ru_stime,
+        wall_time,
+        _file_size(outfile) + error_size,
+    )
+    return status, runtime, usage
+
+
+def compile_program(program, timelim=None, memlim=None):
+    """Compile a problemtools program like Program.compile, but limited to
+    timelim seconds of wall time and memlim MiB of memory.
+
+    The memory limit applies to the data segment rather than the address
+    space, since compilers such as ghc and gccgo reserve far more address
+    space than they use. Like when running programs, it is skipped for
+    languages that manage their own memory limit, such as Java.
+
+    Returns a pair (success, message) like Program.compile.
+    """
+    language = getattr(program, "language", None)
+    if (
+        language is None
+        or language.compile is None
+        or program._compile_result is not None
+    ):
+        return program.compile()
+    command = program.get_compilecmd()
+    compiler = command[0]
+    if not os.path.isfile(compiler) or not os.access(compiler, os.X_OK):
+        # Reports the missing compiler
+        return program.compile()
+    if program.should_skip_memory_rlimit():
+        memlim = None
+    try:
+        returncode, output = run_in_session(command, timelim, memlim)
+    except subprocess.TimeoutExpired:
+        program._compile_result = (
+            False,
+            f"Compilation exceeded the time limit of {timelim} seconds",
+        )
+        return program._compile_result
+    if returncode == 0:
+        program._compile_result = (True, None)
+    else:
+        program._compile_result = (False, output.decode("utf8", "replace"))
+    return program._compile_result
+
+
+def run_in_session(command, timelim=None, memlim=None, cwd=None, capture_output=True):
+    """Run a command in a session of its own, with its data segment limited
+    to memlim MiB, and return its exit code and its combined stdout and
+    stderr, or None unless capture_output is set.
+
+    Any processes the command started are killed once it exits. After
+    timelim seconds of wall time the whole session is killed and
+    TimeoutExpired raised.
+    """
+
+    def set_limits():
+        if memlim is not None:
+            try_limit(resource.RLIMIT_DATA, memlim * (1024**2), resource.RLIM_INFINITY)
+
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE if capture_output else subprocess.DEVNULL,
+        stderr=subprocess.STDOUT if capture_output else subprocess.DEVNULL,
+        cwd=cwd,
+        preexec_fn=set_limits,
+        start_new_session=True,
+    )
+    try:
+        output, _ = process.communicate(timeout=timelim)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.communicate()
+        raise
+    try:
+        # Processes left behind by the command
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    return process.returncode, output
@@ -42,7 +42,6 @@ done
 pip3 install git+https://github.com/Tagl/problemtools@gradescope_autograder
 pip3 install -r requirements.txt
 
-g++ -O3 -o default_validator default_validator.cpp
 popd
 
 if [ -d "$PROBLEMSDIR" ]; then
@@ -50,10 +49,10 @@ if [ -d "$PROBLEMSDIR" ]; then
         [ -d "$problemdir" ] || continue
         pushd "$problemdir"
         echo "Determining time limit..."
-        verifyproblem . -p submissions | tee verifyoutput 
-        cat verifyoutput | grep "setting timelim to" | cut -d ' ' -f 11 > .timelimit
+        python3 "$MAINDIR/calibrate_timelimit.py" .
         echo -n "Time limit in seconds set to: "
         cat .timelimit
+        python3 "$MAINDIR/prepare_problem.py" .
         popd
     done
 else
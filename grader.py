@@ -1,11 +1,18 @@
+import asyncio
+import contextlib
 import functools
+import io
 import json
-import subprocess
+import os
+import shutil
+import signal
 import sys
 import tempfile
+import threading
+import time
 import unittest
-import yaml
 
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from gradescope_utils.autograder_utils.decorators import weight, tags
 from pathlib import Path
@@ -15,7 +22,30 @@ from problemtools.config import ConfigError, load_config
 from problemtools.languages import load_language_config
 from problemtools.run import get_program, BuildRun
 from problemtools.verifyproblem import is_RTE, is_TLE
-from problem_config import load_problem_config
+from build_cache import BuildCache
+from execution import ResourceUsage, compile_program, run_program
+from manifest import load_manifest
+from problem_config import ProblemConfig
+from result_cache import (
+    TIMING_SENSITIVE_FRACTION,
+    ResultCache,
+    cached_file_hash,
+    optional_file_hash,
+    program_hash,
+)
+from results import ResultsWriter
+from scratch import ScratchSpace
+from slots import ExecutionSlots, available_cpus
+from scheduling import TestStatistics, load_test_statistics, order_testcases
+from tracing import TRACER
+from validators import (
+    BatchValidator,
+    DefaultValidator,
+    ProcessValidator,
+    EXIT_AC,
+    EXIT_WA,
+)
+from warmstart import prepare_warm_start
 
 from problemtools.verifyproblem import Problem
 
@@ -24,10 +54,19 @@ if sys.platform != "win32":
 
 PROBLEMS_DIR = Path("problems")
 SUBMISSION_DIR = Path("/autograder/submission")
-EXIT_AC = 42
-EXIT_WA = 43
+RESULTS_PATH = Path("/autograder/results/results.json")
+BUILD_CACHE = BuildCache(Path(__file__).resolve().parent / "build_cache")
+RESULT_CACHE_DIR = Path(__file__).resolve().parent / "result_cache"
 LANGUAGES = load_language_config()
 EPS = 1e-9
+MEBIBYTE = 1024 * 1024
+RESULTS_HEADER = {
+    "output_format": "md",
+    "test_output_format": "md",
+    "test_name_format": "md",
+    "visibility": "visible",
+    "stdout_visibility": "hidden",
+}
 
 
 class UnsupportedLanguage(Exception):
@@ -85,18 +124,83 @@ class TestResult:
         running_time: float,
         message: str = "",
         privileged_message: str = "",
+        usage: ResourceUsage = None,
+        cpu: int = None,
+        validator_usage: ResourceUsage = None,
     ):
         self.verdict: Verdict = verdict
         self.score: int = score
         self.running_time: float = running_time
         self.message: str = message
         self.privileged_message: str = privileged_message
+        self.usage: ResourceUsage = usage
+        # CPU of the execution slot that ran the testcase
+        self.cpu: int = cpu
+        self.validator_usage: ResourceUsage = validator_usage
+
+    def render_feedback(self, show_privileged=True):
+        self.message = str(self.message)
+        if show_privileged:
+            self.privileged_message = str(self.privileged_message)
 
     def get_privileged_feedback(self):
         return TestResult(
-            self.verdict, self.score, self.running_time, self.privileged_message
+            self.verdict,
+            self.score,
+            self.running_time,
+            self.privileged_message,
+            usage=self.usage,
+            cpu=self.cpu,
+            validator_usage=self.validator_usage,
+        )
+
+    def discard_feedback(self):
+        # Only verdict, score and usage are aggregated once the result is written
+        self.message = ""
+        self.privileged_message = ""
+
+    def to_cache_entry(self):
+        return {
+            "verdict": self.verdict.name,
+            "score": self.score,
+            "running_time": self.running_time,
+            "message": self.message if isinstance(self.message, str) else "",
+            # Left unrendered if it is not shown
+            "privileged_message": self.privileged_message
+            if isinstance(self.privileged_message, str)
+            else "",
+            "usage": self.usage.to_dict() if self.usage is not None else None,
+            "validator_usage": self.validator_usage.to_dict()
+            if self.validator_usage is not None
+            else None,
+        }
+
+    @classmethod
+    def from_cache_entry(cls, entry):
+        usage = entry["usage"]
+        validator_usage = entry["validator_usage"]
+        return cls(
+            Verdict[entry["verdict"]],
+            entry["score"],
+            entry["running_time"],
+            entry["message"],
+            entry["privileged_message"],
+            ResourceUsage.from_dict(usage) if usage is not None else None,
+            validator_usage=ResourceUsage.from_dict(validator_usage)
+            if validator_usage is not None
+            else None,
         )
 
+    def get_extra_data(self):
+        extra_data = {}
+        if self.usage is not None:
+            extra_data["resource_usage"] = self.usage.to_dict()
+        if self.cpu is not None:
+            extra_data["cpu"] = self.cpu
+        if self.validator_usage is not None:
+            extra_data["validator_resource_usage"] = self.validator_usage.to_dict()
+        return extra_data
+
     def __str__(self):
         if self.message:
             return f"{verdict_to_str(self.verdict)} ({self.running_time:.4f}s)\n{self.message}"
@@ -163,23 +267,66 @@ def aggregate_results(config: TestdataConfig, results: List[TestResult]):
         else:
             score = sum(result.score for result in results)
 
-    return TestResult(verdict, score, max(result.running_time for result in results))
+    return TestResult(
+        verdict,
+        score,
+        max(result.running_time for result in results),
+        usage=ResourceUsage.combine(result.usage for result in results),
+        validator_usage=ResourceUsage.combine(
+            result.validator_usage for result in results
+        ),
+    )
+
+
+class TestCase:
+    def __init__(
+        self, path: Path, name, input_size=None, answer_size=None, expected_time=None
+    ):
+        self.path = path
+        self.name = name
+        self.input_size = input_size
+        self.answer_size = answer_size
+        self.expected_time = expected_time
+
 
+class TestGroup:
+    def __init__(self, path: Path, config: TestdataConfig, testcases, subgroups):
+        self.path = path
+        self.config = config
+        self.testcases: List[TestCase] = testcases
+        # Empty test group directories are kept as None to preserve numbering
+        self.subgroups: List[TestGroup] = subgroups
 
-def load_testdata_config(path: Path, problem_config, parent_config=None):
-    if path.is_file():
-        with open(path) as f:
-            return TestdataConfig(problem_config, **yaml.safe_load(f))
-    elif parent_config:
-        return parent_config
-    return TestdataConfig(problem_config)
+
+def load_test_group(problem: Path, entry, problem_config):
+    if entry is None:
+        return None
+    return TestGroup(
+        problem / entry["path"],
+        TestdataConfig(problem_config, **entry["testdata"]),
+        [
+            TestCase(
+                problem / testcase["name"],
+                testcase["name"],
+                testcase["input_size"],
+                testcase["answer_size"],
+                testcase.get("expected_time"),
+            )
+            for testcase in entry["testcases"]
+        ],
+        [
+            load_test_group(problem, subgroup, problem_config)
+            for subgroup in entry["subgroups"]
+        ],
+    )
 
 
-def read_file(path):
+def read_file(path, max_length=None):
     result = None
     if path.exists():
-        with open(path) as f:
-            result = f.read()
+        with open(path, errors="replace") as f:
+            # One extra character lets truncate_string notice the truncation
+            result = f.read() if max_length is None else f.read(max_length + 1)
     return result
 
 def truncate_string(s, n):
@@ -188,6 +335,9 @@ def truncate_string(s, n):
     return s
 
 
+FEEDBACK_MAX_LENGTH = 5*10**3
+
+
 def get_feedback_message(
     show_privileged,
     input_data,
@@ -200,7 +350,7 @@ def get_feedback_message(
     error="",
 ):
     lines = []
-    max_length = 5*10**3
+    max_length = FEEDBACK_MAX_LENGTH
     if show_privileged:
         lines.extend([
             "#### Input:",
@@ -236,6 +386,69 @@ def get_feedback_message(
     return "\n".join(lines)
 
 
+class Feedback:
+    """Everything needed to build the feedback messages of a testcase.
+
+    Files are only read when a message is rendered, and only as much of them
+    as fits in the message.
+    """
+
+    def __init__(
+        self,
+        test_name: Path,
+        output_filename: Path,
+        error_filename: Path = None,
+        judge_message="",
+        team_message="",
+        header="",
+    ):
+        self.test_name = test_name
+        self.output_filename = output_filename
+        self.error_filename = error_filename
+        self.judge_message = judge_message
+        self.team_message = team_message
+        self.header = header
+
+    def render(self, show_privileged):
+        test_name = self.test_name
+        input_data = output = answer = error = ""
+        if show_privileged:
+            input_data = read_file(test_name.with_suffix(".in"), FEEDBACK_MAX_LENGTH)
+            output = read_file(self.output_filename, FEEDBACK_MAX_LENGTH) or ""
+            answer = read_file(test_name.with_suffix(".ans"), FEEDBACK_MAX_LENGTH)
+            if self.error_filename is not None:
+                error = read_file(self.error_filename, FEEDBACK_MAX_LENGTH)
+        message = get_feedback_message(
+            show_privileged,
+            input_data,
+            output,
+            answer,
+            self.judge_message,
+            self.team_message,
+            read_file(test_name.with_suffix(".hint")),
+            read_file(test_name.with_suffix(".desc")) if show_privileged else "",
+            error,
+        )
+        return f"{self.header}{message}"
+
+
+class FeedbackMessage:
+    """A feedback message that is rendered the first time it is used."""
+
+    def __init__(self, feedback: Feedback, show_privileged):
+        self.feedback = feedback
+        self.show_privileged = show_privileged
+        self.message = None
+
+    def __str__(self):
+        if self.message is None:
+            self.message = self.feedback.render(self.show_privileged)
+        return self.message
+
+    def __bool__(self):
+        return bool(str(self))
+
+
 def run_testcase(
     program,
     validator,
@@ -245,207 +458,447 @@ def run_testcase(
     grading_config,
     test_name: Path,
     is_sample=False,
+    file_size_limit=None,
 ):
-    test_name = Path(test_name)
-
-    input_filename = test_name.with_suffix(".in")
-    input_data = read_file(input_filename)
+    execution = execute_testcase(
+        program, working_directory, time_limit, config, test_name, file_size_limit
+    )
+    return judge_testcase(
+        execution,
+        validator,
+        working_directory,
+        time_limit,
+        config,
+        grading_config,
+        test_name,
+        is_sample,
+    )
 
-    answer_filename = test_name.with_suffix(".ans")
-    answer = read_file(answer_filename)
 
-    output_filename = Path(working_directory) / "output"
-    error_filename = Path(working_directory) / "error"
+def execute_testcase(
+    program, working_directory, time_limit, config, test_name: Path, file_size_limit=None
+):
+    """Run the submission on a testcase in the working directory, writing
+    its output and error there. Returns a triple (status, running_time,
+    usage) like run_program.
 
-    status, running_time = program.run(
-        infile=str(input_filename),
-        outfile=str(output_filename),
-        errfile=str(error_filename),
-        timelim=int(time_limit + 1.999),
-        memlim=config.limits.memory,
-        set_work_dir=True,
-    )
+    Only the output counts towards the output limit. Of the error, as much
+    as fits within file_size_limit is kept and the rest discarded.
+    """
+    test_name = Path(test_name)
+    output_limit = config.limits.output * MEBIBYTE
+    # One byte over the output limit is enough to tell that it was exceeded
+    if file_size_limit is None:
+        file_size_limit = output_limit + 1
+    error_limit = file_size_limit
+    file_size_limit = min(output_limit + 1, file_size_limit)
+
+    with TRACER.span("run"):
+        return run_program(
+            program,
+            infile=str(test_name.with_suffix(".in")),
+            outfile=str(Path(working_directory) / "output"),
+            errfile=str(Path(working_directory) / "error"),
+            timelim=int(time_limit + 1.999),
+            memlim=config.limits.memory,
+            filelim=file_size_limit,
+            errlim=error_limit,
+            cwd=str(working_directory),
+        )
 
-    hint_filename = test_name.with_suffix(".hint")
-    hint = read_file(hint_filename)
 
-    desc_filename = test_name.with_suffix(".desc")
-    desc = read_file(desc_filename)
+def judge_testcase(
+    execution,
+    validator,
+    working_directory,
+    time_limit,
+    config,
+    grading_config,
+    test_name: Path,
+    is_sample=False,
+):
+    """Judge a run of the submission on a testcase from execute_testcase."""
+    status, running_time, usage = execution
+    test_name = Path(test_name)
 
-    output = read_file(output_filename)
+    input_filename = test_name.with_suffix(".in")
+    answer_filename = test_name.with_suffix(".ans")
+    output_filename = Path(working_directory) / "output"
+    error_filename = Path(working_directory) / "error"
+    output_limit = config.limits.output * MEBIBYTE
 
-    if is_TLE(status) or running_time > time_limit:
-        message = get_feedback_message(is_sample, input_data, output, answer, "", "", hint, desc)
-        privileged_message = get_feedback_message(True, input_data, output, answer, "", "", hint, desc)
+    def reject(verdict, feedback, message=None):
         return TestResult(
-            Verdict.TLE,
+            verdict,
             grading_config.reject_score,
             running_time,
-            message,
-            privileged_message,
-        )
-    if is_RTE(status):
-        error = read_file(error_filename)
-        message = get_feedback_message(
-            is_sample, input_data, output, answer, "", "", hint, desc, error
-        )
-        privileged_message = get_feedback_message(
-            True, input_data, output, answer, "", "", hint, desc, error
+            FeedbackMessage(feedback, is_sample) if message is None else message,
+            FeedbackMessage(feedback, True),
+            usage,
         )
+
+    if is_TLE(status) or running_time > time_limit:
+        return reject(Verdict.TLE, Feedback(test_name, output_filename))
+    # CPython ignores SIGXFSZ, so a Python submission reaching the file size
+    # limit sees failed writes instead and may exit with an error
+    if (
+        os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGXFSZ
+    ) or output_filename.stat().st_size > output_limit:
         return TestResult(
+            Verdict.OLE, grading_config.reject_score, running_time, usage=usage
+        )
+    if is_RTE(status):
+        return reject(
             Verdict.RTE,
-            grading_config.reject_score,
-            running_time,
-            f"#### Exit Code {status}\n{message}",
-            f"#### Exit Code {status}\n{privileged_message}",
+            Feedback(
+                test_name,
+                output_filename,
+                error_filename,
+                header=f"#### Exit Code {status}\n",
+            ),
         )
 
-    output_bytes = output.encode()
-    MEBIBYTE = 1024 * 1024
-    if len(output_bytes) > config.limits.output * MEBIBYTE:
-        return TestResult(Verdict.OLE, grading_config.reject_score, running_time)
-
-    test_feedback_dir = Path(tempfile.mkdtemp(prefix="feedback", dir=working_directory))
-    compare_command = (
-        *validator.get_runcmd(),
-        input_filename,
-        answer_filename,
-        str(test_feedback_dir),
-        *config.validator_flags,
-        *grading_config.output_validator_flags.split()
-    )
-    compare = subprocess.Popen(
-        compare_command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding="utf8"
+    with TRACER.span("validate"):
+        validation = validator.validate(
+            input_filename,
+            answer_filename,
+            output_filename,
+            working_directory,
+            [*config.validator_flags, *grading_config.output_validator_flags.split()],
+        )
+    feedback = Feedback(
+        test_name,
+        output_filename,
+        judge_message=validation.judge_message,
+        team_message=validation.team_message,
     )
-    compare.communicate(output)
-
-    judge_message_filename = test_feedback_dir / "judgemessage.txt"
-    judge_message = read_file(judge_message_filename)
-
-    team_message_filename = test_feedback_dir / "teammessage.txt"
-    team_message = read_file(team_message_filename)
 
-    if compare.returncode == EXIT_WA:
-        message = get_feedback_message(
-            is_sample,
-            input_data,
-            output,
-            answer,
-            judge_message,
-            team_message,
-            hint,
-            desc,
-        )
-        privileged_message = get_feedback_message(
-            True, input_data, output, answer, judge_message, team_message, hint, desc
-        )
-        return TestResult(
-            Verdict.WA,
-            grading_config.reject_score,
-            running_time,
-            message,
-            privileged_message,
+    if validation.limit_exceeded is not None:
+        feedback.judge_message = (
+            f"Output validator exceeded its {validation.limit_exceeded}\n"
+            f"{validation.judge_message or ''}"
         )
-    elif compare.returncode != EXIT_AC:
-        privileged_message = get_feedback_message(
-            True, input_data, output, answer, judge_message, team_message, hint, desc
+        test_result = reject(
+            Verdict.JE,
+            feedback,
+            f"The output validator exceeded its {validation.limit_exceeded}, "
+            "please contact the instructor regarding this error",
         )
-        return TestResult(
+    elif validation.returncode == EXIT_WA:
+        test_result = reject(Verdict.WA, feedback)
+    elif validation.returncode != EXIT_AC:
+        test_result = reject(
             Verdict.JE,
-            grading_config.reject_score,
-            running_time,
+            feedback,
             "Something went horribly wrong, please contact the instructor regarding this error",
-            privileged_message,
         )
-    privileged_message = get_feedback_message(
-        True, input_data, output, answer, judge_message, team_message, hint, desc
-    )
-
-    final_score = grading_config.accept_score
-    score_filename = test_feedback_dir / "score.txt"
-    score_contents = read_file(score_filename)
-    if score_contents is not None:
-        final_score = float(score_contents)
-    return TestResult(
-        Verdict.AC, final_score, running_time, "", privileged_message
-    )
+    else:
+        final_score = grading_config.accept_score
+        if validation.score is not None:
+            final_score = float(validation.score)
+        test_result = TestResult(
+            Verdict.AC, final_score, running_time, "", FeedbackMessage(feedback, True), usage
+        )
+    test_result.validator_usage = validation.usage
+    return test_result
+
+
+def run_testcases_parallel(testcases, run, workers, stop_on_reject):
+    """Run testcases on a pool of workers, yielding results in testcase order.
+
+    If stop_on_reject is set, testcases after the first known rejection are
+    cancelled.
+    """
+
+    def cancel_remaining(index, future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        if stop_on_reject and future.result().verdict != Verdict.AC:
+            for remaining in futures[index + 1:]:
+                remaining.cancel()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run, test) for test in testcases]
+        for index, future in enumerate(futures):
+            future.add_done_callback(functools.partial(cancel_remaining, index))
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def run_testcases_pipelined(testcases, execute, stop_on_reject):
+    """Run testcases one at a time, judging every testcase while the next one
+    runs, and yield results in testcase order.
+
+    execute(test) runs the submission on a testcase and returns a function
+    that judges the run, i.e. validates its output and renders feedback. At
+    most one testcase is judged while another runs, and every testcase that
+    ran is judged. If stop_on_reject is set, no testcase is started after the
+    first known rejection.
+    """
+    loop = asyncio.new_event_loop()
+    # One thread runs the submission while the other judges the previous run
+    executor = ThreadPoolExecutor(max_workers=2)
+    results = [loop.create_future() for _ in testcases]
+    stopped = False
+
+    async def judge(index, judgement):
+        nonlocal stopped
+        try:
+            test_result = await loop.run_in_executor(executor, judgement)
+        except Exception as error:
+            stopped = True
+            results[index].set_exception(error)
+            return
+        if stop_on_reject and test_result.verdict != Verdict.AC:
+            stopped = True
+        results[index].set_result(test_result)
+
+    async def pipeline():
+        judging = None
+        for index, test in enumerate(testcases):
+            if stopped:
+                break
+            try:
+                judgement = await loop.run_in_executor(executor, execute, test)
+            except Exception as error:
+                results[index].set_exception(error)
+                break
+            if judging is not None:
+                await judging
+            judging = loop.create_task(judge(index, judgement))
+        if judging is not None:
+            await judging
+        # Testcases that were never run
+        for result in results:
+            if not result.done():
+                result.set_result(None)
+
+    runner = loop.create_task(pipeline())
+    try:
+        for result in results:
+            test_result = loop.run_until_complete(result)
+            if test_result is None:
+                break
+            yield test_result
+    finally:
+        stopped = True
+        loop.run_until_complete(runner)
+        executor.shutdown()
+        loop.close()
 
 
 def process_test_group(
-    path: Path,
+    group: TestGroup,
     display_prefix,
     program,
     validator,
-    tmpdir,
+    scratch: ScratchSpace,
     time_limit,
     config,
-    parent_config,
-    result,
+    results: ResultsWriter,
     is_sample=False,
+    statistics: TestStatistics = None,
+    slots: ExecutionSlots = None,
+    cache: ResultCache = None,
 ):
-    if not path.exists():
-        # Ignore result if path doesn't exist
+    if group is None:
+        # Ignore missing and empty directories
         return None
+    if slots is None:
+        # Run testcases wherever the scheduler puts them
+        slots = ExecutionSlots([])
 
-    subgroups = []
-    testcases = []
-    testdata_path = path / "testdata.yaml"
-
-    grading_config = load_testdata_config(testdata_path, config, parent_config)
-
-    for subpath in sorted(path.iterdir()):
-        if subpath.is_dir():
-            subgroups.append(subpath)
-        elif subpath.suffix == ".in":
-            testcases.append(subpath.with_suffix(""))
-
-    if not (subgroups or testcases):
-        # Ignore empty directories
-        return None
+    grading_config = group.config
+    testcases = group.testcases
 
-    results = []
+    def show_privileged(test_result):
+        return config.grader.accepted_feedback or test_result.verdict != Verdict.AC
 
-    group_results = []
-    for i, test in enumerate(testcases, 1):
-        test_result = run_testcase(
-            program, validator, tmpdir, time_limit, config, grading_config, test, is_sample
-        )
-        name = f"## {display_prefix} - {i} / {len(testcases)} ({test_result.score:.2f} / {grading_config.max_score:.2f})"
-        # Instructor feedback
-        print(name)
-        print(test_result.get_privileged_feedback())
-        print()
-        result["tests"].append(
-            {
-                "name": name,
-                "status": "passed" if test_result.verdict == Verdict.AC else "failed",
-                "output": f"### {test_result}",
-            }
+    def cacheable(test_result):
+        # Results that could differ on another run are rerun every time
+        return test_result.verdict not in (
+            Verdict.TLE,
+            Verdict.JE,
+        ) and test_result.running_time <= time_limit * TIMING_SENSITIVE_FRACTION
+
+    def cache_lookup(test):
+        """Return the cache key of a testcase and its cached result, if any."""
+        if cache is None:
+            return None, None
+        cache_key = cache.key(
+            cached_file_hash(test.path.with_suffix(".in")),
+            cached_file_hash(test.path.with_suffix(".ans")),
+            # Shown in the feedback stored with the result
+            optional_file_hash(test.path.with_suffix(".hint")),
+            optional_file_hash(test.path.with_suffix(".desc")),
+            grading_config.output_validator_flags,
+            grading_config.accept_score,
+            grading_config.reject_score,
+            is_sample,
         )
-        group_results.append(test_result)
-        if grading_config.on_reject == "break" and test_result.verdict != Verdict.AC:
-            break
+        entry = cache.get(cache_key)
+        if entry is None:
+            return cache_key, None
+        return cache_key, TestResult.from_cache_entry(entry)
+
+    def cache_store(cache_key, test_result):
+        if cache_key is not None and cacheable(test_result):
+            cache.put(cache_key, test_result.to_cache_entry())
+
+    def run(test):
+        with TRACER.span("testcase", group=display_prefix, test=test.name) as span:
+            cache_key, cached = cache_lookup(test)
+            if cached is not None:
+                span.set(verdict=cached.verdict.name, cached=True)
+                return cached
+
+            with scratch.directory() as working_directory, slots.acquire() as cpu:
+                test_result = run_testcase(
+                    program,
+                    validator,
+                    working_directory,
+                    time_limit,
+                    config,
+                    grading_config,
+                    test.path,
+                    is_sample,
+                    scratch.file_size_limit,
+                )
+                # Feedback has to be rendered before the working directory is reused
+                with TRACER.span("feedback"):
+                    test_result.render_feedback(show_privileged(test_result))
+                test_result.cpu = cpu
+                span.set(verdict=test_result.verdict.name, cpu=cpu)
+            cache_store(cache_key, test_result)
+        return test_result
+
+    def execute(test):
+        """Run the submission on a testcase for run_testcases_pipelined."""
+        with TRACER.span("testcase", group=display_prefix, test=test.name) as span:
+            cache_key, cached = cache_lookup(test)
+            if cached is not None:
+                span.set(verdict=cached.verdict.name, cached=True)
+                return lambda: cached
+
+            # The working directory is kept until the run is judged
+            stack = contextlib.ExitStack()
+            working_directory = stack.enter_context(scratch.directory())
+            try:
+                with slots.acquire() as cpu:
+                    execution = execute_testcase(
+                        program,
+                        working_directory,
+                        time_limit,
+                        config,
+                        test.path,
+                        scratch.file_size_limit,
+                    )
+            except BaseException:
+                stack.close()
+                raise
+            span.set(cpu=cpu)
+
+        def judge():
+            with stack, TRACER.span(
+                "judge", group=display_prefix, test=test.name
+            ) as span, slots.acquire():
+                test_result = judge_testcase(
+                    execution,
+                    validator,
+                    working_directory,
+                    time_limit,
+                    config,
+                    grading_config,
+                    test.path,
+                    is_sample,
+                )
+                with TRACER.span("feedback"):
+                    test_result.render_feedback(show_privileged(test_result))
+                test_result.cpu = cpu
+                span.set(verdict=test_result.verdict.name)
+            cache_store(cache_key, test_result)
+            return test_result
+
+        return judge
+
+    stop_on_reject = grading_config.on_reject == "break"
+    # Reordering only pays off when the first rejection decides the group
+    if stop_on_reject and grading_config.score_aggregation == ScoreAggregation.MIN:
+        order = order_testcases(testcases, config.grader.test_order, statistics)
+    else:
+        order = list(range(len(testcases)))
+    scheduled = [testcases[i] for i in order]
+
+    workers = config.grader.workers
+    if slots:
+        workers = min(workers, len(slots))
+    if workers > 1 and len(testcases) > 1:
+        test_results = run_testcases_parallel(scheduled, run, workers, stop_on_reject)
+    elif config.grader.pipeline and len(testcases) > 1:
+        test_results = run_testcases_pipelined(scheduled, execute, stop_on_reject)
     else:
-        for i, subgroup in enumerate(subgroups, 1):
+        test_results = (run(test) for test in scheduled)
+
+    executed = []
+    rejected = False
+    for index, test_result in zip(order, test_results):
+        executed.append((index, test_result))
+        if statistics is not None:
+            statistics.record(testcases[index].name, test_result.verdict != Verdict.AC)
+        if stop_on_reject and test_result.verdict != Verdict.AC:
+            test_results.close()
+            rejected = True
+            break
+
+    # Results are always reported in the canonical order
+    group_results = []
+    with TRACER.span("report", group=display_prefix):
+        for index, test_result in sorted(executed, key=lambda executed_test: executed_test[0]):
+            name = f"## {display_prefix} - {index + 1} / {len(testcases)} ({test_result.score:.2f} / {grading_config.max_score:.2f})"
+            # Instructor feedback
+            print(name)
+            if show_privileged(test_result):
+                print(test_result.get_privileged_feedback())
+            else:
+                print(test_result)
+            print()
+            results.add_test(
+                {
+                    "name": name,
+                    "status": "passed" if test_result.verdict == Verdict.AC else "failed",
+                    "output": f"### {test_result}",
+                    "extra_data": test_result.get_extra_data(),
+                }
+            )
+            test_result.discard_feedback()
+            group_results.append(test_result)
+
+    if not rejected:
+        for i, subgroup in enumerate(group.subgroups, 1):
+            if subgroup is None:
+                continue
             subgroup_prefix = f"{display_prefix} - Test Group {i}"
             subgroup_result = process_test_group(
                 subgroup,
                 subgroup_prefix,
                 program,
                 validator,
-                tmpdir,
+                scratch,
                 time_limit,
                 config,
-                grading_config,
-                result,
+                results,
                 is_sample,
+                statistics,
+                slots,
+                cache,
             )
 
             group_results.append(subgroup_result)
-            if (
-                grading_config.on_reject == "break"
-                and subgroup_result.verdict != Verdict.AC
-            ):
+            if stop_on_reject and subgroup_result.verdict != Verdict.AC:
                 break
 
     group_result = aggregate_results(grading_config, group_results)
@@ -454,20 +907,29 @@ def process_test_group(
     print(name)
     print(group_result.get_privileged_feedback())
     print()
-    result["tests"].append(
-        {
-            "name": name,
-            "status": "passed"
-            if abs(group_result.score - grading_config.max_score) < EPS
-            else "failed",
-            "output": f"### {group_result}",
-        }
-    )
+    with TRACER.span("report", group=display_prefix):
+        results.add_test(
+            {
+                "name": name,
+                "status": "passed"
+                if abs(group_result.score - grading_config.max_score) < EPS
+                else "failed",
+                "output": f"### {group_result}",
+                "extra_data": group_result.get_extra_data(),
+            }
+        )
 
     return group_result
 
 
-def prepare_program(config, program_path, tmpdir, include=None):
+def prepare_program(config, program_path, tmpdir, include=None, phase="compile"):
+    with TRACER.span(phase, program=Path(program_path).name) as span:
+        program, compile_result = _prepare_program(config, program_path, tmpdir, include)
+        span.set(success=compile_result[0])
+    return program, compile_result
+
+
+def _prepare_program(config, program_path, tmpdir, include=None):
     program = get_program(str(program_path), LANGUAGES, str(tmpdir), str(include))
     if program is None:
         compile_result = (
@@ -479,46 +941,179 @@ def prepare_program(config, program_path, tmpdir, include=None):
     elif not config.language_allowed(program.language.lang_id):
         compile_result = (False, str(UnsupportedLanguage(program.language.lang_id)))
     else:
-        compile_result = program.compile()
+        limits = config.limits
+        start = time.monotonic()
+        cache_key = BUILD_CACHE.key(program)
+        if BUILD_CACHE.restore(program, cache_key):
+            compile_result = (True, None)
+        else:
+            compile_result = compile_program(
+                program, limits.compilation_time, limits.compilation_memory
+            )
+        if compile_result[0]:
+            # Within what is left of the compilation time
+            prepare_warm_start(
+                program,
+                max(0.0, limits.compilation_time - (time.monotonic() - start)),
+                limits.compilation_memory,
+                jvm=config.grader.jvm_warm_start,
+            )
+            BUILD_CACHE.store(program, cache_key)
     return program, compile_result
 
 
-def grade_submission(problem, submission):
-    time_limit_file = problem / ".timelimit"
+def find_output_validator(problem):
+    return next((problem / "output_validators").iterdir())
+
+
+def compile_output_validator(problem, config, tmpdir):
+    """Compile the output validator of a problem, if it has one."""
+    if config.validation == "default":
+        return None, (True, None)
+    validator_path = find_output_validator(problem)
+    return prepare_program(config, validator_path, tmpdir, phase="validator_compile")
+
+
+def make_output_validator(config, validator_program):
+    if validator_program is None:
+        return DefaultValidator()
+    if config.grader.batch_validator:
+        return BatchValidator(validator_program, config.limits)
+    return ProcessValidator(validator_program, config.limits)
+
+
+def load_output_validator(problem, config, tmpdir):
+    validator_program, compile_result = compile_output_validator(
+        problem, config, tmpdir
+    )
+    return make_output_validator(config, validator_program), compile_result
+
+
+class LoadedProblem:
+    """Everything needed for grading that depends only on the problem.
+
+    Loading it once allows grading many submissions against the problem
+    without reading its configuration and test data or compiling its
+    output validator again.
+    """
+
+    def __init__(self, problem):
+        self.problem = Path(problem)
+        self.manifest = load_manifest(self.problem)
+        self.config = ProblemConfig(**self.manifest["problem"])
+        self.time_limit = self.manifest["time_limit"]
+        self.grading_config = TestdataConfig(self.config, **self.manifest["testdata"])
+        if self.config.type == "scoring":
+            self.max_score = self.grading_config.max_score
+        else:
+            self.max_score = 100.0
+        self.sample = load_test_group(self.problem, self.manifest["sample"], self.config)
+        self.secret = load_test_group(self.problem, self.manifest["secret"], self.config)
+        self.tmpdir = tempfile.mkdtemp()
+        # Compiled in the background, at the same time as the submission
+        executor = ThreadPoolExecutor(max_workers=1)
+        self._validator = executor.submit(
+            compile_output_validator, self.problem, self.config, self.tmpdir
+        )
+        executor.shutdown(wait=False)
+
+    @property
+    def validator_program(self):
+        return self._validator.result()[0]
+
+    @property
+    def validator_compile_result(self):
+        return self._validator.result()[1]
+
+    def output_validator(self):
+        """Output validator for grading a single submission."""
+        return make_output_validator(self.config, self.validator_program)
+
+    def cleanup(self):
+        # The validator may still be compiling if the submission did not
+        self._validator.result()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+def grade_submission(problem, submission, results_path=RESULTS_PATH, slots=None):
+    """Grade a submission against a problem, given by its directory or as a
+    LoadedProblem, and write its results.json to results_path."""
+    if isinstance(problem, LoadedProblem):
+        with TRACER.span("grade", problem=problem.problem.name):
+            _grade_submission(problem, submission, results_path, slots)
+        return
+    with TRACER.span("grade", problem=Path(problem).name):
+        loaded = LoadedProblem(problem)
+        _grade_submission(loaded, submission, results_path, slots)
+        loaded.cleanup()
+
+
+def _grade_submission(loaded: LoadedProblem, submission, results_path, slots):
+    problem = loaded.problem
     include = problem / "include"
-    problem_yaml = problem / "problem.yaml"
-    data = problem / "data"
-    sample = data / "sample"
-    secret = data / "secret"
+    config = loaded.config
+    time_limit = loaded.time_limit
+    grading_config = loaded.grading_config
+    max_score = loaded.max_score
 
     tmpdir = tempfile.mkdtemp()
-    config = load_problem_config(problem_yaml)
-    with open(time_limit_file) as f:
-        time_limit = float(f.readline())
     program, compile_result = prepare_program(config, submission, tmpdir, include)
+    if not config.grader.pin_cpus:
+        slots = None
+    elif slots is None:
+        slots = ExecutionSlots()
+    workers = config.grader.workers
+    if slots:
+        workers = min(workers, len(slots))
+    scratch_slots = workers
+    if config.grader.pipeline and workers == 1:
+        # One run being judged while the next one runs
+        scratch_slots = 2
+    scratch = ScratchSpace(
+        config.grader.scratch_quota * MEBIBYTE,
+        scratch_slots,
+        config.limits.output * MEBIBYTE,
+    )
 
-    if config.validation == "default":
-        output_validator, validator_compile_result = prepare_program(config, 'default_validator', tmpdir)
-    else:
-        output_validators = problem / "output_validators"
-        validator_path = next(output_validators.iterdir())
-        output_validator, validator_compile_result = prepare_program(config, validator_path, tmpdir)
-
-    result = {
-        "output_format": "md",
-        "test_output_format": "md",
-        "test_name_format": "md",
-        "visibility": "visible",
-        "stdout_visibility": "hidden",
-        "extra_data": {},
-        "tests": [],
-    }
+    output_validator = None
+    if compile_result[0]:
+        # Waits for the output validator to finish compiling
+        output_validator = loaded.output_validator()
+
+    cache = None
+    if config.grader.result_cache and compile_result[0]:
+        cache = ResultCache(
+            RESULT_CACHE_DIR,
+            config.grader.result_cache * MEBIBYTE,
+            [
+                program_hash(program),
+                program_hash(loaded.validator_program),
+                config.validator_flags,
+                time_limit,
+                config.limits.memory,
+                config.limits.output,
+                scratch.file_size_limit,
+                config.grader.accepted_feedback,
+            ],
+        )
+
+    results = ResultsWriter(
+        results_path,
+        RESULTS_HEADER,
+        {
+            "score": 0.0,
+            "max_score": max_score,
+            "output": "# Grading did not finish",
+            "extra_data": {},
+        },
+        config.grader.feedback_budget * 1024,
+    )
 
-    result["tests"].append(
+    results.add_test(
         {"name": "## Metadata", "status": "passed", "output": str(config)}
     )
 
-    result["tests"].append(
+    results.add_test(
         {
             "name": "## Compilation",
             "status": "passed" if compile_result[0] else "failed",
@@ -528,22 +1123,26 @@ def grade_submission(problem, submission):
 
     final_result: TestResult = None
 
-    grading_config = load_testdata_config(data / "testdata.yaml", config, None)
+    statistics = None
+    if config.grader.test_order == "failure_rate":
+        statistics = load_test_statistics(problem)
 
     if compile_result[0]:
         test_results = []
 
         sample_result = process_test_group(
-            sample,
+            loaded.sample,
             "Sample testcases",
             program,
             output_validator,
-            tmpdir,
+            scratch,
             time_limit,
             config,
-            grading_config,
-            result,
+            results,
             True,
+            statistics,
+            slots,
+            cache,
         )
 
         run_secret = True
@@ -558,49 +1157,215 @@ def grade_submission(problem, submission):
 
         if run_secret:
             secret_result = process_test_group(
-                secret,
+                loaded.secret,
                 "Secret testcases",
                 program,
                 output_validator,
-                tmpdir,
+                scratch,
                 time_limit,
                 config,
-                grading_config,
-                result,
+                results,
+                False,
+                statistics,
+                slots,
+                cache,
             )
             test_results.append(secret_result)
 
         final_result = aggregate_results(grading_config, test_results)
+        output_validator.close()
+        if statistics is not None:
+            statistics.save()
     else:
         final_result = TestResult(Verdict.CE, grading_config.reject_score, 0.0)
 
+    summary = {}
     if final_result.verdict == Verdict.AC:
-        result["execution_time"] = final_result.running_time
+        summary["execution_time"] = final_result.running_time
 
     if config.type == "scoring":
-        result["score"] = final_result.score
-        result["max_score"] = grading_config.max_score
+        summary["score"] = final_result.score
     else:
-        result["score"] = 100.0 if final_result.verdict == Verdict.AC else 0.0
-        result["max_score"] = 100.0
+        summary["score"] = 100.0 if final_result.verdict == Verdict.AC else 0.0
+    summary["max_score"] = max_score
 
-    result["output"] = f"# {final_result}"
+    summary["output"] = f"# {final_result}"
+    summary["extra_data"] = {}
+    if cache is not None:
+        summary["extra_data"]["result_cache"] = cache.to_dict()
 
-    with open("/autograder/results/results.json", "w") as results_file:
-        results_file.write(
-            json.dumps(result, indent=4, ensure_ascii=False).encode("utf8").decode()
-        )
+    results.finish(summary)
+
+    scratch.cleanup()
+    shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def find_problems():
+    return sorted(
+        problem
+        for problem in PROBLEMS_DIR.iterdir()
+        if problem.is_dir() and (problem / "problem.yaml").exists()
+    )
+
+
+def find_problem_directory(problem, submission):
+    """Find the directory of a submission named after the given problem,
+    case insensitively. Returns None if the submission has none."""
+    name = problem.name.lower()
+    for path in Path(submission).iterdir():
+        if path.is_dir() and path.name.lower() == name:
+            return path
+    return None
+
+
+def find_problem_submission(problem, submission, tmpdir):
+    """Find the part of a submission that solves the given problem.
+
+    That is a directory named after the problem, or otherwise the files named
+    after the problem regardless of extension, which are copied into a
+    directory of their own within tmpdir. Names are matched case insensitively.
+    Returns None if the submission has neither.
+    """
+    directory = find_problem_directory(problem, submission)
+    if directory is not None:
+        return directory
+    name = problem.name.lower()
+    files = [
+        path
+        for path in Path(submission).iterdir()
+        if path.is_file() and path.name.split(".")[0].lower() == name
+    ]
+    if not files:
+        return None
+    directory = Path(tmpdir) / problem.name
+    directory.mkdir()
+    for path in files:
+        shutil.copy2(path, directory)
+    return directory
+
+
+class ThreadOutput(io.TextIOBase):
+    """Standard output that threads can redirect to a buffer of their own.
+
+    contextlib.redirect_stdout replaces sys.stdout for every thread, so it
+    cannot keep the output of problems graded at the same time apart.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Buffer what the calling thread prints, yielding the buffer."""
+        self.local.buffer = io.StringIO()
+        try:
+            yield self.local.buffer
+        finally:
+            del self.local.buffer
+
+    def write(self, text):
+        return getattr(self.local, "buffer", self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def grade_problems(problems, submission, results_path=RESULTS_PATH):
+    """Grade a submission against several problems at once.
+
+    Problems are graded by at most one thread per available CPU, each into a
+    results.json of its own, and these are combined into a single one at
+    results_path, with the test names prefixed by the problem name and the
+    scores summed up. The output of every problem is buffered and printed in
+    problem order. Problems that pin CPUs share a single set of slots. With
+    a single problem, the whole submission is used unless it has a directory
+    named after the problem.
+    """
+    if len(problems) == 1:
+        problem_submission = find_problem_directory(problems[0], submission)
+        grade_submission(problems[0], problem_submission or submission, results_path)
+        return
 
+    tmpdir = tempfile.mkdtemp()
+    submissions = {
+        problem: find_problem_submission(problem, submission, tmpdir)
+        for problem in problems
+    }
+
+    results = ResultsWriter(
+        results_path,
+        RESULTS_HEADER,
+        {"score": 0.0, "output": "# Grading did not finish", "extra_data": {}},
+    )
+    slots = ExecutionSlots()
+    empty = Path(tmpdir) / "empty"
+    empty.mkdir()
+
+    output = ThreadOutput(sys.stdout)
 
-def find_problem():
-    for problem in Path("problems").iterdir():
-        if problem.is_dir() and (problem / "problem.yaml").exists():
-            return problem
+    def grade(problem):
+        problem_results = Path(tmpdir) / f"{problem.name}.json"
+        with output.capture() as log:
+            grade_submission(
+                problem, submissions[problem] or empty, problem_results, slots
+            )
+        with open(problem_results) as f:
+            return json.load(f), log.getvalue()
+
+    problem_results = []
+    workers = min(len(problems), len(available_cpus()) or os.cpu_count() or 1)
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for problem_result, log in executor.map(grade, problems):
+                output.stream.write(log)
+                problem_results.append(problem_result)
+    finally:
+        sys.stdout = output.stream
+
+    summary = {"score": 0.0, "max_score": 0.0}
+    execution_times = []
+    lines = []
+    for problem, problem_result in zip(problems, problem_results):
+        summary["score"] += problem_result["score"]
+        summary["max_score"] += problem_result["max_score"]
+        if "execution_time" in problem_result:
+            execution_times.append(problem_result["execution_time"])
+        verdict = problem_result["output"].lstrip("# ")
+        output = f"{verdict} ({problem_result['score']:g} / {problem_result['max_score']:g})"
+        if submissions[problem] is None:
+            output += (
+                f"\n\nNo files for {problem.name} were found in the submission. "
+                f"Submit them in a directory named {problem.name}/ "
+                f"or name them {problem.name}.<extension>."
+            )
+        passed = problem_result["score"] >= problem_result["max_score"] - EPS
+        results.add_test(
+            {
+                "name": f"# {problem.name}",
+                "status": "passed" if passed else "failed",
+                "output": output,
+            }
+        )
+        for test in problem_result["tests"]:
+            name = test["name"].replace("## ", f"## {problem.name} - ", 1)
+            results.add_test({**test, "name": name})
+        lines.append(f"- {problem.name}: {verdict}")
+
+    if len(execution_times) == len(problems):
+        summary["execution_time"] = sum(execution_times)
+    summary["output"] = "# Total\n\n" + "\n".join(lines)
+    summary["extra_data"] = {
+        problem.name: problem_result.get("extra_data", {})
+        for problem, problem_result in zip(problems, problem_results)
+    }
+    results.finish(summary)
+    shutil.rmtree(tmpdir, ignore_errors=True)
 
 
 def main():
-    problem = find_problem()
-    grade_submission(problem, "/autograder/submission")
+    grade_problems(find_problems(), SUBMISSION_DIR)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import yaml
+
+from pathlib import Path
+
+MANIFEST_FILENAME = ".manifest.json"
+MANIFEST_VERSION = 2
+TIMING_PROFILE_FILENAME = ".timing_profile.json"
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ManifestBuilder:
+    """Walks a problem directory once and describes everything the grader
+    needs: problem configuration, time limit and the tree of test groups with
+    their resolved testdata.yaml options. Test cases are annotated with their
+    expected running time if the problem has a timing profile.
+
+    Every file and directory that was looked at is recorded with its
+    modification time and size, and configuration files also with their
+    hash, so that a stored manifest can be checked for staleness.
+    """
+
+    def __init__(self, problem: Path):
+        self.problem = problem
+        self.files = {}
+        self.hashes = {}
+        self.expected_times = {}
+
+    def relative(self, path: Path):
+        return str(path.relative_to(self.problem))
+
+    def record(self, path: Path, with_hash=False):
+        stat = path.stat()
+        self.files[self.relative(path)] = [stat.st_mtime_ns, stat.st_size]
+        if with_hash:
+            self.hashes[self.relative(path)] = file_hash(path)
+        return stat
+
+    def load_yaml(self, path: Path):
+        self.record(path, with_hash=True)
+        with open(path) as f:
+            return yaml.safe_load(f) or {}
+
+    def load_timing_profile(self):
+        path = self.problem / TIMING_PROFILE_FILENAME
+        if not path.is_file():
+            return
+        self.record(path, with_hash=True)
+        with open(path) as f:
+            profile = json.load(f)
+        self.expected_times = {
+            name: timing["median"] for name, timing in profile["testcases"].items()
+        }
+
+    def test_group(self, path: Path, parent_options):
+        if not path.is_dir():
+            return None
+        self.record(path)
+
+        options = parent_options
+        testdata_path = path / "testdata.yaml"
+        if testdata_path.is_file():
+            options = self.load_yaml(testdata_path)
+
+        testcases = []
+        subgroups = []
+        for subpath in sorted(path.iterdir()):
+            if subpath.is_dir():
+                subgroups.append(self.test_group(subpath, options))
+            elif subpath.suffix == ".in":
+                answer_path = subpath.with_suffix(".ans")
+                name = self.relative(subpath.with_suffix(""))
+                testcases.append(
+                    {
+                        "name": name,
+                        "input_size": self.record(subpath).st_size,
+                        "answer_size": self.record(answer_path).st_size
+                        if answer_path.exists()
+                        else None,
+                        "expected_time": self.expected_times.get(name),
+                    }
+                )
+
+        if not (subgroups or testcases):
+            return None
+
+        return {
+            "path": self.relative(path),
+            "testdata": options,
+            "testcases": testcases,
+            "subgroups": subgroups,
+        }
+
+    def build(self):
+        problem_options = self.load_yaml(self.problem / "problem.yaml")
+        time_limit_file = self.problem / ".timelimit"
+        self.record(time_limit_file, with_hash=True)
+        with open(time_limit_file) as f:
+            time_limit = float(f.readline())
+        self.load_timing_profile()
+
+        data = self.problem / "data"
+        data_options = {}
+        if (data / "testdata.yaml").is_file():
+            data_options = self.load_yaml(data / "testdata.yaml")
+
+        return {
+            "version": MANIFEST_VERSION,
+            "problem": problem_options,
+            "time_limit": time_limit,
+            "testdata": data_options,
+            "sample": self.test_group(data / "sample", data_options),
+            "secret": self.test_group(data / "secret", data_options),
+            "files": self.files,
+            "hashes": self.hashes,
+        }
+
+
+def build_manifest(problem: Path):
+    return ManifestBuilder(Path(problem)).build()
+
+
+def write_manifest(problem: Path):
+    problem = Path(problem)
+    manifest = build_manifest(problem)
+    temporary = problem / f"{MANIFEST_FILENAME}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(temporary, problem / MANIFEST_FILENAME)
+    return manifest
+
+
+def is_stale(problem: Path, manifest):
+    if manifest.get("version") != MANIFEST_VERSION:
+        return True
+    hashes = manifest["hashes"]
+    for name, (mtime, size) in manifest["files"].items():
+        path = problem / name
+        try:
+            stat = path.stat()
+        except OSError:
+            return True
+        if stat.st_mtime_ns == mtime and stat.st_size == size:
+            continue
+        # Configuration files that were touched without changing are fine
+        if name not in hashes or hashes[name] != file_hash(path):
+            return True
+    return False
+
+
+def load_manifest(problem: Path):
+    """Load the manifest stored in the problem directory.
+
+    Falls back to building it from the problem directory if there is none or
+    it is stale.
+    """
+    problem = Path(problem)
+    try:
+        with open(problem / MANIFEST_FILENAME) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return build_manifest(problem)
+    if is_stale(problem, manifest):
+        return build_manifest(problem)
+    return manifest
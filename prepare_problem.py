@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+ Prepares a problem for grading while the autograder image is set up,
+ so that work shared by every grading run is only done once.
+
+ This compiles the problem's output validator into the build cache used
+ by grader.py and writes the problem's test data manifest. Run it after
+ the time limit has been determined, as the manifest records it.
+
+ Example:
+    $ python3 prepare_problem.py problems/hello
+"""
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+from grader import find_output_validator, prepare_program
+from manifest import MANIFEST_FILENAME, write_manifest
+from problem_config import load_problem_config
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+
+    argsparser = argparse.ArgumentParser(
+        description="Prepare a problem for grading with grader.py."
+    )
+    argsparser.add_argument("problemdir", help="Path to problem directory")
+    return argsparser.parse_args()
+
+
+def prepare_output_validator(problem: Path, config):
+    """Compile the output validator into the build cache."""
+    if config.validation == "default":
+        return
+    validator_path = find_output_validator(problem)
+    _, compile_result = prepare_program(config, validator_path, tempfile.mkdtemp())
+    if not compile_result[0]:
+        sys.exit(
+            f"FATAL: Failed to compile output validator {validator_path}:\n"
+            f"{compile_result[1]}"
+        )
+    print(f"Output validator {validator_path} compiled")
+
+
+def main():
+    args = parse_args()
+    problem = Path(args.problemdir)
+    config = load_problem_config(problem / "problem.yaml")
+    prepare_output_validator(problem, config)
+    write_manifest(problem)
+    print(f"Test data manifest written to {problem / MANIFEST_FILENAME}")
+
+
+if __name__ == "__main__":
+    main()
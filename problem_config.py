@@ -25,6 +25,20 @@ class Limits:
         return '\n'.join(lines)
 
 
+class GraderConfig:
+    def __init__(self, **kwargs):
+        self.workers = int(kwargs.get('workers', 1))
+        self.accepted_feedback = kwargs.get('accepted_feedback', True)
+        self.test_order = kwargs.get('test_order', 'canonical')
+        self.batch_validator = kwargs.get('batch_validator', False)
+        self.scratch_quota = int(kwargs.get('scratch_quota', 1024))
+        self.feedback_budget = int(kwargs.get('feedback_budget', 4096))
+        self.pin_cpus = kwargs.get('pin_cpus', False)
+        self.result_cache = int(kwargs.get('result_cache', 0))
+        self.pipeline = kwargs.get('pipeline', False)
+        self.jvm_warm_start = kwargs.get('jvm_warm_start', False)
+
+
 class ProblemConfig:
     def __init__(self, *, name, **kwargs):
         self.name = name
@@ -45,6 +59,7 @@ class ProblemConfig:
         if self.languages is not None:
             self.languages = set(self.languages.split())
         self.limits = Limits(**kwargs.get('limits', {}))
+        self.grader = GraderConfig(**kwargs.get('grader', {}))
 
     def language_allowed(self, language_id):
         return self.languages is None or language_id in self.languages
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+ Regrades a directory of submissions against a problem, for example after
+ its test data has been fixed.
+
+ Every file or directory within the submissions directory is one
+ submission. The problem's configuration and test data are loaded and its
+ output validator compiled once, before a pool of worker processes grades
+ the submissions in parallel. Every submission gets a results file
+ <name>.json and a log <name>.log of the instructor feedback in the output
+ directory, which also gets a summary.csv of the scores of all submissions.
+
+ Examples:
+    $ python3 regrade.py problems/hello submissions
+    $ python3 regrade.py problems/hello submissions --output regraded --workers 8
+"""
+
+import argparse
+import contextlib
+import csv
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from grader import LoadedProblem, grade_submission
+from slots import ExecutionSlots, available_cpus
+
+SUMMARY_FILENAME = "summary.csv"
+SUMMARY_COLUMNS = ["submission", "score", "max_score", "verdict", "execution_time"]
+
+# Loaded before the worker processes are forked, so that they share it
+PROBLEM: LoadedProblem = None
+SLOTS: ExecutionSlots = None
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+
+    argsparser = argparse.ArgumentParser(
+        description="Regrade a directory of submissions against a problem."
+    )
+    argsparser.add_argument("problemdir", help="Path to problem directory")
+    argsparser.add_argument(
+        "submissions", help="Directory with one file or directory per submission"
+    )
+    argsparser.add_argument(
+        "--output",
+        default="regrade",
+        help="Directory to write results and summary to (default regrade)",
+    )
+    argsparser.add_argument(
+        "--workers",
+        type=int,
+        default=len(available_cpus()) or os.cpu_count() or 1,
+        help="Number of submissions graded in parallel (default: number of CPUs)",
+    )
+    return argsparser.parse_args()
+
+
+def find_submissions(directory: Path):
+    return sorted(
+        path for path in directory.iterdir() if not path.name.startswith(".")
+    )
+
+
+def init_worker(cpus):
+    global SLOTS
+    if PROBLEM.config.grader.pin_cpus and available_cpus():
+        # Every worker process grades on a CPU of its own
+        SLOTS = ExecutionSlots([cpus.get()])
+
+
+def regrade(submission: Path, output: Path):
+    results_path = output / f"{submission.name}.json"
+    with open(output / f"{submission.name}.log", "w") as log:
+        with contextlib.redirect_stdout(log):
+            grade_submission(PROBLEM, submission, results_path, SLOTS)
+    with open(results_path) as f:
+        results = json.load(f)
+    return {
+        "submission": submission.name,
+        "score": results["score"],
+        "max_score": results["max_score"],
+        "verdict": results["output"].lstrip("# "),
+        "execution_time": results.get("execution_time", ""),
+    }
+
+
+def main():
+    global PROBLEM
+    args = parse_args()
+    submissions = find_submissions(Path(args.submissions))
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+
+    PROBLEM = LoadedProblem(args.problemdir)
+    if not PROBLEM.validator_compile_result[0]:
+        sys.exit(
+            "FATAL: Failed to compile output validator:\n"
+            f"{PROBLEM.validator_compile_result[1]}"
+        )
+
+    workers = args.workers
+    context = multiprocessing.get_context("fork")
+    cpus = context.Queue()
+    if PROBLEM.config.grader.pin_cpus and available_cpus():
+        workers = min(workers, len(available_cpus()))
+        for cpu in available_cpus():
+            cpus.put(cpu)
+
+    rows = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=context,
+        initializer=init_worker,
+        initargs=(cpus,),
+    ) as executor:
+        futures = {
+            executor.submit(regrade, submission, output): submission
+            for submission in submissions
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            submission = futures[future]
+            try:
+                row = future.result()
+            except Exception as error:
+                row = {
+                    "submission": submission.name,
+                    "verdict": f"Grading failed: {error!r}",
+                }
+            rows.append(row)
+            print(f"[{done}/{len(submissions)}] {submission.name}: {row['verdict']}")
+    PROBLEM.cleanup()
+
+    rows.sort(key=lambda row: row["submission"])
+    with open(output / SUMMARY_FILENAME, "w", newline="") as f:
+        writer = csv.DictWriter(f, SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"Summary written to {output / SUMMARY_FILENAME}")
+
+
+if __name__ == "__main__":
+    main()
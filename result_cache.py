@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from pathlib import Path
+
+from manifest import file_hash
+
+CACHE_VERSION = 1
+# Results slower than this fraction of the time limit could turn into a time
+# limit exceeded on another run, so they are not cached
+TIMING_SENSITIVE_FRACTION = 0.5
+# Eviction removes entries until the cache is down to this fraction of its
+# size, so that it is not needed again after every store
+EVICTION_TARGET = 0.9
+
+# (path, size, modification time) -> hash of the file's contents
+_FILE_HASHES = {}
+
+
+def cached_file_hash(path):
+    """Hash of a file, hashed once per process unless the file changes."""
+    stat = os.stat(path)
+    memo_key = (str(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _FILE_HASHES:
+        _FILE_HASHES[memo_key] = file_hash(path)
+    return _FILE_HASHES[memo_key]
+
+
+def program_hash(program):
+    """Hash of a program's language, its compile and run commands and its
+    source files.
+
+    Compiled binaries are not hashed, as they are not reproducible: they can
+    embed the temporary directory they were compiled in.
+    """
+    if program is None:
+        return None
+    digest = hashlib.sha256()
+    digest.update(program.language.lang_id.encode())
+    digest.update(b"\0")
+    digest.update((program.language.compile or "").encode())
+    digest.update(b"\0")
+    digest.update((program.language.run or "").encode())
+    digest.update(b"\0")
+    root = Path(program.path)
+    for path in sorted(program.src):
+        digest.update(str(Path(path).relative_to(root)).encode())
+        digest.update(b"\0")
+        digest.update(cached_file_hash(path).encode())
+    return digest.hexdigest()
+
+
+def optional_file_hash(path):
+    """cached_file_hash of a file, or None if it does not exist."""
+    if not os.path.isfile(path):
+        return None
+    return cached_file_hash(path)
+
+
+class ResultCache:
+    """On-disk cache of test case results, bounded to max_size bytes.
+
+    Entries are keyed on the parts given to key() along with the context,
+    the key parts shared by every test case of a grading run. Reading an
+    entry marks it as most recently used, and once the cache grows beyond
+    its size the least recently used entries are evicted. Hits and misses
+    are counted for the results.json of the grading run.
+    """
+
+    def __init__(self, directory, max_size, context=()):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.context = list(context)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # Total size of the entries, scanned when the first entry is stored
+        self.size = None
+
+    def key(self, *parts):
+        data = json.dumps([CACHE_VERSION, *self.context, *parts], default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def get(self, key):
+        path = self.directory / f"{key}.json"
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            # Most recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            entry = None
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        data = json.dumps(entry, separators=(",", ":")).encode()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(prefix=f".{key}-", dir=self.directory)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temporary, self.directory / f"{key}.json")
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self._entries())
+            else:
+                self.size += len(data)
+            if self.size > self.max_size:
+                self._evict()
+
+    def _entries(self):
+        for path in self.directory.glob("*.json"):
+            try:
+                stat = path.stat()
+            except OSError:
+                # Evicted by another grader
+                continue
+            yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        size = sum(size for _, size, _ in entries)
+        for path, entry_size, _ in entries:
+            if size <= self.max_size * EVICTION_TARGET:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            size -= entry_size
+        self.size = size
+
+    def to_dict(self):
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,75 @@
+import json
+
+from pathlib import Path
+
+from tracing import TRACER
+
+FEEDBACK_OMITTED = (
+    "\n\nFurther feedback is omitted, the autograder's feedback budget is used up."
+)
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False).encode("utf8")
+
+
+class ResultsWriter:
+    """Writes results.json incrementally, one test entry at a time.
+
+    Every entry is written as soon as it is added, followed by a tail closing
+    the tests list and the top level object. The next entry overwrites the
+    tail, so the file is valid JSON at all times. Until finish() is called,
+    the tail holds the fields of the unfinished summary, so that a grading
+    run that is interrupted still leaves a valid results.json behind.
+
+    The outputs of test entries share a budget of feedback_budget characters.
+    Once it is used up, outputs are cut down to their first line.
+    """
+
+    def __init__(self, path: Path, header, unfinished, feedback_budget=None):
+        self.file = open(path, "wb")
+        self.unfinished = unfinished
+        self.feedback_budget = feedback_budget
+        self.feedback_used = 0
+        self.tests = 0
+        self.file.write(_dumps(header)[:-1] + b', "tests": [')
+        self.position = self.file.tell()
+        self._write_tail(self.unfinished)
+
+    def _write_tail(self, summary):
+        self.file.seek(self.position)
+        self.file.write(b"\n]")
+        if summary:
+            self.file.write(b", " + _dumps(summary)[1:])
+        else:
+            self.file.write(b"}")
+        self.file.truncate()
+        self.file.flush()
+
+    def _fit_budget(self, output):
+        if self.feedback_budget is None:
+            return output
+        if self.feedback_used + len(output) > self.feedback_budget:
+            first_line, _, rest = output.partition("\n")
+            if rest:
+                output = first_line + FEEDBACK_OMITTED
+        self.feedback_used += len(output)
+        return output
+
+    def add_test(self, entry):
+        with TRACER.span("write_results"):
+            self._add_test(entry)
+
+    def _add_test(self, entry):
+        if "output" in entry:
+            entry = {**entry, "output": self._fit_budget(entry["output"])}
+        self.file.seek(self.position)
+        self.file.write((b",\n" if self.tests else b"\n") + _dumps(entry))
+        self.tests += 1
+        self.position = self.file.tell()
+        self._write_tail(self.unfinished)
+
+    def finish(self, summary):
+        with TRACER.span("write_results"):
+            self._write_tail(summary)
+            self.file.close()
@@ -0,0 +1,80 @@
+import fcntl
+import json
+import os
+
+from pathlib import Path
+
+STATISTICS_FILENAME = ".test_statistics.json"
+
+TEST_ORDERS = ("canonical", "cheapest_first", "failure_rate")
+
+
+class TestStatistics:
+    """How often each test case of a problem has rejected past submissions.
+
+    Saving adds the runs recorded since loading to the statistics on disk
+    while holding a lock, so that concurrent grading runs of the same
+    problem, such as those of regrade.py, do not lose each other's runs.
+    """
+
+    def __init__(self, path: Path, runs=None):
+        self.path = path
+        # Test case name -> [number of runs, number of rejections]
+        self.runs = runs or {}
+        self.recorded = {}
+
+    def record(self, name, rejected):
+        for counts in (self.runs, self.recorded):
+            runs = counts.setdefault(name, [0, 0])
+            runs[0] += 1
+            runs[1] += int(rejected)
+
+    def failure_rate(self, name):
+        runs, rejections = self.runs.get(name, (0, 0))
+        # Laplace smoothing keeps test cases without history in the middle
+        return (rejections + 1) / (runs + 2)
+
+    def save(self):
+        with open(self.path.with_name(self.path.name + ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            runs = _read_statistics(self.path)
+            for name, (count, rejections) in self.recorded.items():
+                saved = runs.setdefault(name, [0, 0])
+                saved[0] += count
+                saved[1] += rejections
+            temporary = self.path.with_name(self.path.name + ".tmp")
+            with open(temporary, "w") as f:
+                json.dump(runs, f, separators=(",", ":"))
+            os.replace(temporary, self.path)
+        self.runs = runs
+        self.recorded = {}
+
+
+def _read_statistics(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_test_statistics(problem: Path):
+    path = Path(problem) / STATISTICS_FILENAME
+    return TestStatistics(path, _read_statistics(path))
+
+
+def order_testcases(testcases, test_order, statistics=None):
+    """Return the indices of testcases in the order they should be run."""
+    indices = list(range(len(testcases)))
+    if test_order == "cheapest_first":
+        if all(testcase.expected_time is not None for testcase in testcases):
+            # Timing profile written by calibrate_timelimit.py
+            indices.sort(key=lambda i: testcases[i].expected_time)
+        else:
+            indices.sort(
+                key=lambda i: (testcases[i].input_size or 0)
+                + (testcases[i].answer_size or 0)
+            )
+    elif test_order == "failure_rate" and statistics is not None:
+        indices.sort(key=lambda i: -statistics.failure_rate(testcases[i].name))
+    return indices
@@ -0,0 +1,73 @@
+import contextlib
+import os
+import queue
+import shutil
+import tempfile
+
+from pathlib import Path
+
+TMPFS_DIRECTORY = Path("/dev/shm")
+# Output and error file of the submission
+FILES_PER_DIRECTORY = 2
+
+
+def clear_directory(directory: Path):
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.unlink(entry.path)
+
+
+class ScratchSpace:
+    """Working directories for the files written while running a testcase.
+
+    The directories live on tmpfs if it has room for the whole quota and on
+    disk otherwise. They are cleared and reused after every testcase, so at
+    most one directory per slot, i.e. per testcase running at the same time,
+    is ever created. Files written by the submission are limited to
+    file_size_limit bytes so that all slots together stay within the quota.
+    The limit is never below output_limit + 1 bytes, which is what telling
+    an output at the limit from one exceeding it takes, and the quota is
+    raised to match if it is too small for that.
+    """
+
+    def __init__(self, quota, slots=1, output_limit=0):
+        self.slots = slots
+        self.file_size_limit = max(
+            quota // (slots * FILES_PER_DIRECTORY), output_limit + 1
+        )
+        self.quota = max(quota, self.file_size_limit * slots * FILES_PER_DIRECTORY)
+        self.on_tmpfs = self._tmpfs_has_room()
+        self.root = Path(
+            tempfile.mkdtemp(
+                prefix="scratch", dir=TMPFS_DIRECTORY if self.on_tmpfs else None
+            )
+        )
+        self.idle = queue.SimpleQueue()
+
+    def _tmpfs_has_room(self):
+        try:
+            return (
+                os.access(TMPFS_DIRECTORY, os.W_OK)
+                and shutil.disk_usage(TMPFS_DIRECTORY).free >= self.quota
+            )
+        except OSError:
+            return False
+
+    @contextlib.contextmanager
+    def directory(self):
+        """Lend an empty directory, which is cleared when it is returned."""
+        try:
+            directory = self.idle.get_nowait()
+        except queue.Empty:
+            directory = Path(tempfile.mkdtemp(prefix="slot", dir=self.root))
+        try:
+            yield directory
+        finally:
+            clear_directory(directory)
+            self.idle.put(directory)
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,51 @@
+import contextlib
+import os
+import queue
+
+
+def available_cpus():
+    if not hasattr(os, "sched_getaffinity"):
+        return []
+    return sorted(os.sched_getaffinity(0))
+
+
+class ExecutionSlots:
+    """Dedicated CPUs for running testcases, one testcase per CPU at a time.
+
+    A thread holding a slot is pinned to its CPU, so the submission and
+    validator processes it starts inherit the pinning, as does validation
+    done within the thread itself. Sized from the CPUs the grader may use.
+    """
+
+    def __init__(self, cpus=None):
+        self.cpus = available_cpus() if cpus is None else list(cpus)
+        self.idle = queue.SimpleQueue()
+        for cpu in self.cpus:
+            self.idle.put(cpu)
+
+    def __len__(self):
+        return len(self.cpus)
+
+    @contextlib.contextmanager
+    def acquire(self):
+        """Pin the calling thread to a free CPU, waiting for one if needed.
+
+        Yields the CPU, or None if CPUs cannot be pinned on this platform.
+        """
+        if not self.cpus:
+            yield None
+            return
+        cpu = self.idle.get()
+        previous = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, {cpu})
+        try:
+            yield cpu
+        finally:
+            os.sched_setaffinity(0, previous)
+            self.idle.put(cpu)
+
+
+def pin_process(pid):
+    """Pin a running process to the CPUs of the calling thread."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(pid, os.sched_getaffinity(0))
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+ Summarizes where grading time went from a trace written by the grader.
+
+ Tracing is enabled by setting GRADER_TRACE to the path of a JSON lines file
+ that events are appended to. For every test group the time spent in each
+ phase is summed over its test cases: running the submission, validating
+ its output, rendering feedback and the rest of the test case (other),
+ as well as reporting the group's results. With parallel workers or the
+ pipeline the sums can exceed the wall time of the group.
+
+ Examples:
+    $ GRADER_TRACE=trace.jsonl python3 grader.py
+    $ python3 summarize_trace.py trace.jsonl
+    $ python3 summarize_trace.py trace.jsonl --json
+"""
+
+import argparse
+import json
+from collections import defaultdict
+
+TEST_PHASES = ["run", "validate", "feedback"]
+SETUP_PHASES = ["compile", "validator_compile"]
+
+
+def parse_args() -> argparse.Namespace:
+    """Parse command line arguments."""
+
+    argsparser = argparse.ArgumentParser(
+        description="Summarize where grading time went from a grader trace."
+    )
+    argsparser.add_argument("trace", help="JSON lines trace written by the grader")
+    argsparser.add_argument(
+        "--json", action="store_true", help="print the summary as JSON"
+    )
+    return argsparser.parse_args()
+
+
+def load_events(path):
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def summarize(events):
+    groups = defaultdict(lambda: defaultdict(float))
+    testcases = defaultdict(int)
+    setup = defaultdict(float)
+    for event in events:
+        phase = event["phase"]
+        group = event.get("group")
+        if group is None:
+            setup[phase] += event["duration"]
+            continue
+        if phase == "testcase":
+            testcases[group] += 1
+        elif phase == "judge":
+            # With the pipeline, the part of the test case after the run
+            phase = "testcase"
+        elif phase == "write_results":
+            # Part of the report phase
+            continue
+        groups[group][phase] += event["duration"]
+
+    summary = {"setup": dict(setup), "groups": {}}
+    for group, phases in groups.items():
+        phases = dict(phases)
+        phases["other"] = max(
+            0.0,
+            phases.get("testcase", 0.0)
+            - sum(phases.get(phase, 0.0) for phase in TEST_PHASES),
+        )
+        summary["groups"][group] = {"testcases": testcases[group], **phases}
+    return summary
+
+
+def print_summary(summary):
+    columns = ["testcase", *TEST_PHASES, "other", "report"]
+    name_width = max([len("Group"), *map(len, summary["groups"])])
+    print(
+        f"{'Group':<{name_width}}  {'Tests':>5}"
+        + "".join(f"  {column:>10}" for column in columns)
+    )
+    for group, phases in summary["groups"].items():
+        print(
+            f"{group:<{name_width}}  {phases['testcases']:>5}"
+            + "".join(f"  {phases.get(column, 0.0):>9.3f}s" for column in columns)
+        )
+
+    setup = summary["setup"]
+    print()
+    for phase in [*SETUP_PHASES, "write_results"]:
+        if phase in setup:
+            print(f"{phase}: {setup[phase]:.3f}s")
+    if "grade" in setup:
+        testcase_time = sum(
+            phases.get("testcase", 0.0) for phases in summary["groups"].values()
+        )
+        print(
+            f"grade: {setup['grade']:.3f}s, of which {testcase_time:.3f}s in test cases"
+        )
+
+
+def main():
+    args = parse_args()
+    summary = summarize(load_events(args.trace))
+    if args.json:
+        print(json.dumps(summary, indent=4))
+    else:
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,18 @@
  be provided as a file, as in:
  $ verifyproblem myproblem -l info > tmplog.txt
  $ python3 analyzetestgroups.py --file tmplog.txt
+ The file may also be gzip compressed, which suits the large logs of
+ problems with many test cases:
+ $ verifyproblem myproblem -l info | gzip > tmplog.txt.gz
+ $ python3 analyzetestgroups.py --file tmplog.txt.gz
+
+ Alternatively, --jobs runs verifyproblem separately for every submission,
+ that many at a time, and merges their logs:
+ $ python3 analyzetestgroups.py --jobs 4 myproblem
+ The accepted submissions run first, since the time limit for the others
+ follows from their running times, just as verifyproblem determines it.
+ Running submissions concurrently slows them down, so keep --jobs below
+ the number of CPUs when running times matter.
 
  Assumptions:
      Correctness:
@@ -44,7 +56,10 @@
 """
 
 import sys
+import os
 import re
+import gzip
+import time
 import subprocess
 import argparse
 import itertools
@@ -52,7 +67,8 @@ import logging
 from enum import Enum, auto
 from pathlib import Path
 from collections import defaultdict, OrderedDict
-from typing import List, Optional, Union, Tuple, Dict, Callable, Pattern, TextIO
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple, Dict, Callable, Pattern, TextIO
 
 import yaml
 
@@ -70,12 +86,20 @@ def parse_args() -> argparse.Namespace:
             """
     )
     argsparser.add_argument("problemdir", help="Path to problem directory")
-    argsparser.add_argument(
+    source = argsparser.add_mutually_exclusive_group()
+    source.add_argument(
         "-f",
         "--file",
         dest="logfile",
-        type=open,
-        help="read logfile instead of running verifyproblem -l info",
+        type=open_log,
+        help="read logfile, possibly gzip compressed, instead of running "
+        "verifyproblem -l info",
+    )
+    source.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="run verifyproblem separately for every submission, JOBS at a time",
     )
     argsparser.add_argument(
         "-l",
@@ -92,9 +116,53 @@ def parse_args() -> argparse.Namespace:
 
 
 STATUS_ENABLED = True
-def print_status_line(s: str):
-    if STATUS_ENABLED:
-        print(s, end="\r")
+STATUS_INTERVAL = 0.1  # least number of seconds between status line updates
+_status_time = -STATUS_INTERVAL
+
+
+def print_status_line(s: str, force: bool = False):
+    """Overwrite the status line with s, unless it was updated less than
+    STATUS_INTERVAL seconds ago and force is not set. Printing an empty
+    string clears the status line.
+    """
+    global _status_time
+    if not STATUS_ENABLED:
+        return
+    now = time.monotonic()
+    if force or now - _status_time >= STATUS_INTERVAL:
+        _status_time = now
+        print(f"{s:80}", end="\r")
+
+
+def open_log(path: str) -> TextIO:
+    """Open a verifyproblem log, which may be gzip compressed."""
+    with open(path, "rb") as file:
+        compressed = file.read(2) == b"\x1f\x8b"
+    if compressed:
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def combine_patterns(patterns: Dict[Callable, Pattern]):
+    """Combine patterns into a single pattern with one alternative per pattern.
+
+    The alternative of a pattern is a group named after its function, and the
+    function's name and two underscores prefix the names of the groups within.
+    Returns the combined pattern and a dict from alternative names to their
+    function and the names of the groups within, without and with the prefix.
+    """
+    alternatives = []
+    groups = {}
+    for fun, pattern in patterns.items():
+        prefix = f"{fun.__name__}__"
+        source = re.sub(r"\(\?P<(\w+)>", rf"(?P<{prefix}\1>", pattern.pattern)
+        flags = "x" if pattern.flags & re.VERBOSE else ""
+        alternatives.append(f"(?P<{fun.__name__}>(?{flags}:{source}))")
+        groups[fun.__name__] = (
+            fun,
+            [(name, prefix + name) for name in pattern.groupindex],
+        )
+    return re.compile("|".join(alternatives)), groups
 
 
 class Grade(Enum):
@@ -233,11 +301,16 @@ class VerificationLogParser:
     VerificationLogParser.pattern and dispatches to class methods accordingly,
     slowly building a proper Problem object in self.problem.
 
+    Most lines of a log match none of them, so lines without any of
+    VerificationLogParser.keywords are skipped, and the others are matched
+    against all patterns at once, combined into one.
+
     Performs various sanity checks on the log to stay in sync.
     """
 
-    def __init__(self, problem):
+    def __init__(self, problem, announce=True):
         self.problem: Problem = problem
+        self.announce = announce  # print the problem name when seeing it
         self.tc_times = None  # list of AC times of current test group
         self.tc_id = None  # current testcase id
         self.sub = None  # current submission
@@ -254,13 +327,14 @@ class VerificationLogParser:
         """Dispatch the given line among the class methods, based on which
         VerificationLogParser.pattern matches.
         """
-        for fun, pattern in VerificationLogParser.patterns.items():
-            match = pattern.search(line)
-            if match:
-                fun(self, match.groupdict())
-                statusline = f"Submission {self.sub}, test case {self.tc_id}"
-                print_status_line(" " * 80)
-                print_status_line(statusline[:80])
+        if not any(map(line.__contains__, VerificationLogParser.keywords)):
+            return
+        match = VerificationLogParser.combined_pattern.search(line)
+        if match:
+            fun, names = VerificationLogParser.groups[match.lastgroup]
+            fun(self, {name: match.group(group) for name, group in names})
+            statusline = f"Submission {self.sub}, test case {self.tc_id}"
+            print_status_line(statusline[:80])
 
     def _first_line(self, matchgroup):
         """Loading problem <problemname>"""
@@ -270,8 +344,9 @@ class VerificationLogParser:
                 f"FATAL: Problem directory does not match log file ({self.problem.name})."
                 "Aborting..."
             )
-        print_status_line(" " * 80)
-        print(f"\033[01mAnalyzing problem: {self.problem.name}\033[0m")
+        if self.announce:
+            print_status_line("", force=True)
+            print(f"\033[01mAnalyzing problem: {self.problem.name}\033[0m")
 
     def _start_submission(self, matchgroup):
         """INFO : Check <type> submission <name>")"""
@@ -285,7 +360,6 @@ class VerificationLogParser:
 
     def _ac_tc_result(self, matchgroup):
         """Test file result ... AC ... <time> ... test case ... <case>"""
-        print_status_line(f"{self.problem.name} {self.sub}")
         self.tc_times.append(float(matchgroup["time"]))
         self.tc_id = matchgroup["case"]
 
@@ -364,6 +438,17 @@ class VerificationLogParser:
             re.VERBOSE,
         ),
     }
+    # Every line matching some pattern contains one of these
+    keywords = (
+        "Loading problem",
+        "Grade on test case group",
+        "INFO : Check",
+        "INFO : Running on test case group",
+        "est file result",
+        "setting timelim",
+        "submission",
+    )
+    combined_pattern, groups = combine_patterns(patterns)
 
 
 class Problem:
@@ -378,17 +463,48 @@ class Problem:
             by verifyproblem
     """
 
-    def __init__(self, problempath, inputstream: Union[TextIO]):
+    def __init__(
+        self, problempath, inputstream: Optional[TextIO] = None, part: bool = False
+    ):
+        """Parse the verifyproblem log in inputstream, if given.
+
+        A part is the log of some of the problem's submissions, to be
+        merged with the other parts by Problem.merge(). It is parsed
+        quietly and checked only once merged.
+        """
         self.path = problempath
         self.submissions: List[Submission] = []
         self.timelimits = None, None
+        self.groups: List[str] = []
+        if inputstream is None:
+            return
 
-        parser = VerificationLogParser(self)
+        parser = VerificationLogParser(self, announce=not part)
         parser.parse(inputstream)
-
-        # sanity check: make sure every submission has verdicts for
-        # "sample", "1", "2", ... and that the number of groups is consistent
         self.groups = list(str(i) for i in range(1, parser.max_group_id + 1))
+        if not part:
+            self.check_groups()
+
+    @classmethod
+    def merge(
+        cls, problempath, parts: List["Problem"], timelimits: Tuple[int, int]
+    ) -> "Problem":
+        """Combine the parts, in the order verifyproblem would have checked
+        their submissions, into the problem that one log of them all gives.
+        """
+        problem = cls(problempath)
+        for part in parts:
+            problem.submissions.extend(part.submissions)
+            if len(part.groups) > len(problem.groups):
+                problem.groups = part.groups
+        problem.timelimits = timelimits
+        problem.check_groups()
+        return problem
+
+    def check_groups(self):
+        """Sanity check: make sure every submission has verdicts for
+        "sample", "1", "2", ... and that the number of groups is consistent
+        """
         allgroups = ["sample"] + self.groups
         for sub in self.submissions:
             if list(sub.verdict.keys()) != allgroups:  # Note: verdict is ordered dict
@@ -466,6 +582,100 @@ class Problem:
             )
 
 
+# Submission names that verifyproblem considers, as in its Submissions class
+SUBMISSION_NAME = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9_.-]*[a-zA-Z0-9](\.c\+\+)?$")
+
+
+def verifyproblem_command(problemdir: str) -> List[str]:
+    return ["verifyproblem", problemdir, "-l", "info", "-p", "submissions"]
+
+
+def find_submissions(problempath: Path) -> List[Tuple[SubmissionType, str]]:
+    """The submissions of the problem, in the order verifyproblem checks them."""
+    submissions = []
+    for stype in SubmissionType:
+        directory = problempath / "submissions" / stype.value
+        if directory.is_dir():
+            for name in sorted(os.listdir(directory)):
+                if SUBMISSION_NAME.match(name):
+                    submissions.append((stype, name))
+    return submissions
+
+
+def init_worker():
+    # Only the main process reports progress
+    global STATUS_ENABLED
+    STATUS_ENABLED = False
+
+
+def verify_submission(
+    problemdir: str, submission: Tuple[SubmissionType, str], timelim: Optional[int]
+) -> Problem:
+    """Run verifyproblem on a single submission and parse its log.
+
+    Without a timelim, verifyproblem determines the time limit from the
+    submission if it is accepted, and uses its default otherwise.
+    """
+    stype, name = submission
+    command = verifyproblem_command(problemdir)
+    command += ["-s", f"^{re.escape(os.path.join(stype.value, name))}$"]
+    if timelim is not None:
+        command += ["-t", str(timelim)]
+    with subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        encoding="utf-8",
+        universal_newlines=True,
+        bufsize=1,
+    ) as verifyproblem:
+        return Problem(Path(problemdir).resolve(), verifyproblem.stdout, part=True)
+
+
+def verify_in_parallel(problemdir: str, jobs: int) -> Problem:
+    """Run verifyproblem separately for every submission, jobs at a time,
+    and merge their logs into the problem a single run of it gives.
+
+    verifyproblem sets the time limit from the slowest accepted submission
+    before checking the others, so the accepted submissions run first and
+    the others with that time limit.
+    """
+    problempath = Path(problemdir).resolve()
+    submissions = find_submissions(problempath)
+    accepted = [sub for sub in submissions if sub[0] == SubmissionType.AC]
+    others = [sub for sub in submissions if sub[0] != SubmissionType.AC]
+    print_status_line("", force=True)
+    print(f"\033[01mAnalyzing problem: {problempath.name}\033[0m")
+
+    def run(executor, subs, timelim):
+        parts = []
+        futures = [
+            executor.submit(verify_submission, problemdir, sub, timelim)
+            for sub in subs
+        ]
+        for future, (_, name) in zip(futures, subs):
+            print_status_line(f"Running verifyproblem on {name}...", force=True)
+            parts.append(future.result())
+        return parts
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker) as executor:
+        accepted_parts = run(executor, accepted, None)
+        # Each run sets the time limit from its own submission, which
+        # grows with the running time, so the slowest one sets it for all.
+        # Runs without a checked submission, e.g. as it failed to compile,
+        # do not count, like in verifyproblem.
+        timelimits = [part.timelimits for part in accepted_parts if part.submissions]
+        timelim = max(timelimits)[0] if timelimits else None
+        other_parts = run(executor, others, timelim)
+    parts = accepted_parts + other_parts
+    if timelimits:
+        timelimits = max(timelimits)
+    elif parts:
+        timelimits = parts[0].timelimits
+    else:
+        timelimits = None, None
+    return Problem.merge(problempath, parts, timelimits)
+
+
 def main():
     """Parse (typically invoking verifyproblem as a subprocess), analyze, print."""
     args = parse_args()
@@ -488,21 +698,21 @@ def main():
                 "%s is not a scoring problem. Aborting...", args.problemdir
             )
             sys.exit(1)
-    if not args.logfile:
+    problempath = Path(args.problemdir).resolve()
+    if args.jobs:
+        problem = verify_in_parallel(args.problemdir, args.jobs)
+    elif not args.logfile:
         verifyproblem = subprocess.Popen(
-            ["verifyproblem", args.problemdir, "-l", "info", "-p", "submissions"],
+            verifyproblem_command(args.problemdir),
             stdout=subprocess.PIPE,
             encoding="utf-8",
             universal_newlines=True,
             bufsize=1,
         )
-        print_status_line(f"Running {' '.join(verifyproblem.args)}...")
-        inputstream = verifyproblem.stdout
+        print_status_line(f"Running {' '.join(verifyproblem.args)}...", force=True)
+        problem = Problem(problempath, verifyproblem.stdout)
     else:
-        inputstream = args.logfile
-    problempath = Path(args.problemdir).resolve()
-
-    problem = Problem(problempath, inputstream)
+        problem = Problem(problempath, args.logfile)
     problem.print_table()
     print(f"Time limit: {problem.timelimits[0]}s, safe: {problem.timelimits[1]}s")
     problem.check_distinguished()
@@ -0,0 +1,240 @@
+"""
+ Differential tests of validators.DefaultValidator against the C++ default
+ validator it replaces, default_validator/default_validator.cpp. Both judge
+ the same answer and output files with the same flags and must agree on the
+ exit code and the judge message.
+"""
+
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import REPOSITORY
+from validators import DefaultValidator, read_feedback_file
+
+SOURCE = REPOSITORY / "default_validator" / "default_validator.cpp"
+
+MODES = [
+    [],
+    ["case_sensitive"],
+    ["space_change_sensitive"],
+    ["case_sensitive", "space_change_sensitive"],
+    ["float_tolerance", "1e-6"],
+    ["float_absolute_tolerance", "0.5"],
+    ["float_relative_tolerance", "1e-3"],
+    ["float_absolute_tolerance", "1e-9", "float_relative_tolerance", "1e-4"],
+    ["case_sensitive", "float_tolerance", "0.01"],
+    ["space_change_sensitive", "float_tolerance", "0.01"],
+]
+
+CASES = [
+    # (answer, output)
+    (b"", b""),
+    (b"", b"\n"),
+    (b"", b"extra\n"),
+    (b"42\n", b""),
+    (b"42\n", b"42"),
+    (b"42\n", b"42\n"),
+    (b"42\n", b"42   \n\n\n"),
+    (b"42\n", b"  42\n"),
+    (b"42\n", b"42\t\n"),
+    (b"42\n", b"42\r\n"),
+    (b"42\n", b"43\n"),
+    (b"42\n", b"42 43\n"),
+    (b"1 2 3\n", b"1\n2\n3\n"),
+    (b"1 2 3\n", b"1  2 3\n"),
+    (b"1 2 3\n", b"1 2\n"),
+    (b"1\n2\n3\n", b"1\n2\n4\n"),
+    (b"Yes\n", b"yes\n"),
+    (b"Yes\n", b"YES\n"),
+    (b"Yes\n", b"No\n"),
+    (b"Hello World\n", b"hello world\n"),
+    (b"1.0\n", b"1.0000001\n"),
+    (b"1.0\n", b"1.1\n"),
+    (b"1.0\n", b"1.6\n"),
+    (b"1000000\n", b"1000999\n"),
+    (b"0.5\n", b"abc\n"),
+    (b"abc\n", b"0.5\n"),
+    (b"1e3\n", b"1000\n"),
+    (b"1E-3\n", b"0.001\n"),
+    (b"-0\n", b"0\n"),
+    (b"+5\n", b"5\n"),
+    (b".5\n", b"0.5\n"),
+    (b"5.\n", b"5\n"),
+    (b"0x10\n", b"16\n"),
+    (b"0x1p3\n", b"8\n"),
+    (b"inf\n", b"inf\n"),
+    (b"nan\n", b"nan\n"),
+    (b"1e400\n", b"1e400\n"),
+    (b"1.5abc\n", b"1.5abc\n"),
+    (b"1.5abc\n", b"1.5\n"),
+    (b"3.14159 2.71828\n", b"3.14160 2.71829\n"),
+    (b"a\0b\n", b"a\0c\n"),
+    (b"caf\xc3\xa9\n", b"CAF\xc3\xa9\n"),
+    (b"\xff\xfe\n", b"\xfe\xff\n"),
+    (b"x" * 100000 + b"\n", b"x" * 100000 + b"\n"),
+    (b"x" * 100000 + b"\n", b"x" * 99999 + b"y\n"),
+    (b" ".join(b"%d" % i for i in range(100000)) + b"\n",
+     b" ".join(b"%d" % i for i in range(100000)) + b"\n"),
+    (b" ".join(b"%d" % i for i in range(100000)) + b"\n",
+     b" ".join(b"%d" % i for i in range(99999)) + b" 0\n"),
+    (b"\n".join(b"%d.5" % i for i in range(50000)) + b"\n",
+     b"\n".join(b"%d.5000001" % i for i in range(50000)) + b"\n"),
+    (b"\n".join(b"line %d" % i for i in range(50000)) + b"\n",
+     b"\n".join(b"LINE %d" % i for i in range(50000)) + b"   \n\n  \t\n"),
+    (b"\n".join(b"line %d" % i for i in range(50000)) + b"\n",
+     b"\n".join(b"line %d" % i for i in range(50000)) + b"\n\n"),
+    (b"\n".join(b"line %d" % i for i in range(50000)) + b"\n",
+     b"\n".join(b"line %d" % i for i in range(50000)) + b" trailing\n"),
+    (b"1_000\n", b"1000\n"),
+    (b"1000 inf 2\n", b"1000.0 inf 2.0\n"),
+    # Floats printed with different precision, compared in bulk
+    (b"\n".join(b"%.6f" % (i / 7) for i in range(50000)) + b"\n",
+     b"\n".join(b"%.9f" % (i / 7) for i in range(50000)) + b"\n"),
+    (b"\n".join(b"%.6f" % (i / 7) for i in range(50000)) + b"\n",
+     b"\n".join(b"%.9f" % (i / 7 + (i == 40000)) for i in range(50000)) + b"\n"),
+    (b" ".join(b"%.3e" % (i * 1.5) for i in range(50000)) + b"\n",
+     b" ".join(b"%.5E" % (i * 1.5) for i in range(50000)) + b"\n"),
+    (b" ".join(b"%.2f x%d" % (i / 3, i) for i in range(50000)) + b"\n",
+     b" ".join(b"%.4f X%d" % (i / 3, i) for i in range(50000)) + b"\n"),
+    # Tokens differing in case only, with a whitespace change deep within
+    (b" ".join(b"word%d" % i for i in range(50000)) + b"\n",
+     b" ".join(b"WORD%d" % i for i in range(50000)) + b"\n"),
+    (b" ".join(b"word%d" % i for i in range(50000)) + b"\n",
+     b" ".join(b"WORD%d" % i for i in range(30000)) + b"  "
+     + b" ".join(b"WORD%d" % i for i in range(30000, 50000)) + b"\n"),
+]
+
+INVALID_FLAGS = [
+    ["unknown_flag"],
+    ["float_tolerance"],
+    ["float_tolerance", "abc"],
+]
+
+
+@pytest.fixture(scope="session")
+def reference(tmp_path_factory):
+    """Path to the compiled C++ default validator."""
+    if shutil.which("g++") is None:
+        pytest.skip("g++ is needed to compile the reference validator")
+    binary = tmp_path_factory.mktemp("reference") / "default_validator"
+    subprocess.run(["g++", "-O2", "-o", str(binary), str(SOURCE)], check=True)
+    return binary
+
+
+def judge_with_reference(reference, directory, flags):
+    feedback = directory / "feedback"
+    feedback.mkdir()
+    with open(directory / "output", "rb") as output:
+        returncode = subprocess.run(
+            [
+                "default_validator",
+                str(directory / "input"),
+                str(directory / "answer"),
+                str(feedback),
+                *flags,
+            ],
+            executable=str(reference),
+            stdin=output,
+            stderr=subprocess.DEVNULL,
+        ).returncode
+    return returncode, read_feedback_file(feedback / "judgemessage.txt") or ""
+
+
+def judge(directory, flags):
+    result = DefaultValidator().validate(
+        directory / "input", directory / "answer", directory / "output", directory, flags
+    )
+    return result.returncode, result.judge_message
+
+
+def write_case(directory, answer, output):
+    directory.mkdir()
+    (directory / "input").write_bytes(b"")
+    (directory / "answer").write_bytes(answer)
+    (directory / "output").write_bytes(output)
+
+
+def assert_agree(reference, directory, answer, output, flags):
+    write_case(directory, answer, output)
+    assert judge(directory, flags) == judge_with_reference(reference, directory, flags)
+
+
+@pytest.mark.parametrize("flags", MODES, ids=" ".join)
+@pytest.mark.parametrize("case", range(len(CASES)))
+def test_cases(reference, tmp_path, flags, case):
+    answer, output = CASES[case]
+    assert_agree(reference, tmp_path / "case", answer, output, flags)
+
+
+@pytest.mark.parametrize("flags", INVALID_FLAGS, ids=" ".join)
+def test_invalid_flags(reference, tmp_path, flags):
+    directory = tmp_path / "case"
+    write_case(directory, b"1\n", b"1\n")
+    returncode, message = judge(directory, flags)
+    # The C++ validator aborts before its buffered usage message is written
+    assert returncode == judge_with_reference(reference, directory, flags)[0]
+    assert message.startswith("Usage: ")
+
+
+def random_tokens(rng, count):
+    tokens = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            tokens.append(b"%d" % rng.randint(-1000, 1000))
+        elif kind < 0.7:
+            tokens.append(b"%.*f" % (rng.randint(0, 8), rng.uniform(-100, 100)))
+        else:
+            tokens.append(
+                bytes(rng.choice(b"aAbBzZ") for _ in range(rng.randint(1, 4)))
+            )
+    return tokens
+
+
+def random_space(rng):
+    return bytes(rng.choice(b"  \t\n\n\r") for _ in range(rng.randint(1, 3)))
+
+
+def perturb(rng, tokens):
+    tokens = list(tokens)
+    for _ in range(rng.randint(0, 2)):
+        i = rng.randrange(len(tokens))
+        change = rng.random()
+        if change < 0.3:
+            tokens[i] = tokens[i].swapcase()
+        elif change < 0.6:
+            try:
+                value = float(tokens[i]) * (1 + rng.choice([1e-9, 1e-5, 1e-2]))
+                tokens[i] = b"%.10g" % value
+            except ValueError:
+                tokens[i] += b"x"
+        elif change < 0.8:
+            del tokens[i]
+            if not tokens:
+                break
+        else:
+            tokens.insert(i, b"7")
+    return tokens
+
+
+def join(rng, tokens, spaces=None):
+    spaces = spaces or [random_space(rng) for _ in tokens]
+    return b"".join(token + space for token, space in zip(tokens, spaces))
+
+
+@pytest.mark.parametrize("flags", MODES, ids=" ".join)
+def test_random(reference, tmp_path, flags):
+    rng = random.Random(" ".join(flags))
+    for i in range(100):
+        tokens = random_tokens(rng, rng.randint(1, 30))
+        spaces = [random_space(rng) for _ in tokens]
+        answer = join(rng, tokens, spaces)
+        if rng.random() < 0.5:
+            # Same tokens, possibly with the same spacing
+            output = join(rng, perturb(rng, tokens), spaces if i % 2 else None)
+        else:
+            output = join(rng, perturb(rng, tokens))
+        assert_agree(reference, tmp_path / f"case{i}", answer, output, flags)
@@ -0,0 +1,106 @@
+"""
+ Batch protocol between the grader and long-lived output validators.
+
+ A batch validator is started once with the single argument --batch and
+ then validates any number of test cases. Grader and validator exchange
+ frames over the validator's stdin and stdout: a 4 byte big-endian length
+ followed by that many bytes of UTF-8 encoded JSON.
+
+ The grader first sends {"protocol": 1} and the validator answers with the
+ same frame. Then every request
+    {"input": path, "answer": path, "output": path, "flags": [...]}
+ is answered by
+    {"verdict": "AC" or "WA", "score": number or null,
+     "judge_message": str, "team_message": str}
+
+ Python validators can use run_validator, which speaks this protocol when
+ started with --batch and otherwise behaves like a regular one-shot
+ validator, so the same validator also works with verifyproblem:
+
+    from validator_protocol import run_validator
+
+    def validate(input_filename, answer_filename, output_file, flags):
+        ...
+        return {"verdict": "AC"}
+
+    run_validator(validate)
+"""
+
+import json
+import os
+import struct
+import sys
+
+from pathlib import Path
+
+PROTOCOL_VERSION = 1
+BATCH_ARGUMENT = "--batch"
+EXIT_AC = 42
+EXIT_WA = 43
+
+_length = struct.Struct(">I")
+
+
+def write_frame(stream, message):
+    payload = json.dumps(message).encode()
+    stream.write(_length.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def read_frame(stream):
+    """Read a frame from a binary stream, returning None at end of file."""
+    header = stream.read(_length.size)
+    if len(header) < _length.size:
+        return None
+    (length,) = _length.unpack(header)
+    payload = stream.read(length)
+    if len(payload) < length:
+        return None
+    return json.loads(payload)
+
+
+def _response(result):
+    return {
+        "verdict": result.get("verdict", "WA"),
+        "score": result.get("score"),
+        "judge_message": result.get("judge_message", ""),
+        "team_message": result.get("team_message", ""),
+    }
+
+
+def serve(validate, requests, responses):
+    """Answer batch requests read from requests until end of file."""
+    hello = read_frame(requests)
+    if hello is None or hello.get("protocol") != PROTOCOL_VERSION:
+        sys.exit(f"Unsupported batch protocol: {hello}")
+    write_frame(responses, {"protocol": PROTOCOL_VERSION})
+    while (request := read_frame(requests)) is not None:
+        with open(request["output"], "rb") as output_file:
+            result = validate(
+                request["input"], request["answer"], output_file, request["flags"]
+            )
+        write_frame(responses, _response(result))
+
+
+def run_once(validate, argv):
+    """Validate a single test case with the usual output validator interface."""
+    input_filename, answer_filename, feedback_dir, *flags = argv
+    result = _response(validate(input_filename, answer_filename, sys.stdin.buffer, flags))
+    feedback_dir = Path(feedback_dir)
+    if result["judge_message"]:
+        (feedback_dir / "judgemessage.txt").write_text(result["judge_message"])
+    if result["team_message"]:
+        (feedback_dir / "teammessage.txt").write_text(result["team_message"])
+    if result["score"] is not None:
+        (feedback_dir / "score.txt").write_text(f"{result['score']}\n")
+    sys.exit(EXIT_AC if result["verdict"] == "AC" else EXIT_WA)
+
+
+def run_validator(validate):
+    """Run validate as an output validator, in batch mode if requested."""
+    if sys.argv[1:] != [BATCH_ARGUMENT]:
+        run_once(validate, sys.argv[1:])
+    # Frames go to the original stdout, anything printed by validate to stderr
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    serve(validate, sys.stdin.buffer, responses)
@@ -0,0 +1,698 @@
+import math
+import os
+import queue
+import re
+import select
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+from problemtools.run.limit import try_limit
+from execution import ResourceUsage, run_program
+from problem_config import Limits
+from validator_protocol import BATCH_ARGUMENT, PROTOCOL_VERSION, read_frame, write_frame
+from slots import pin_process
+from warmstart import warm_start_command
+
+if sys.platform != "win32":
+    import resource
+
+EXIT_AC = 42
+EXIT_WA = 43
+# The C++ default validator reports judge errors through a failed assertion
+EXIT_JUDGE_ERROR = -signal.SIGABRT
+
+CHUNK_SIZE = 1 << 16
+# Number of buffered bytes compared at once before falling back to single tokens
+BULK_SIZE = 1 << 13
+# Number of single tokens compared after a bulk comparison made no progress
+BULK_BACKOFF = 16
+WHITESPACE = b" \t\n\v\f\r"
+NON_WHITESPACE = bytes(c for c in range(256) if c not in WHITESPACE)
+DECIMAL_CHARACTERS = b"0123456789+-.eE"
+
+_space_pattern = re.compile(rb"[ \t\n\v\f\r]*")
+_token_pattern = re.compile(rb"[^ \t\n\v\f\r]*")
+_split_pattern = re.compile(rb"([^ \t\n\v\f\r]+)")
+# glibc's scanf accepts a dangling exponent marker, e.g. "1e" is read as 1
+_decimal_pattern = re.compile(
+    rb"([+-]?(?:\d+\.?\d*|\.\d+))(?:([eE][+-]?\d+)|[eE][+-]?)?"
+)
+_hexadecimal_pattern = re.compile(
+    rb"([+-]?0[xX](?:[0-9a-fA-F]+\.?[0-9a-fA-F]*|\.[0-9a-fA-F]+))"
+    rb"(?:([pP][+-]?\d+)|[pP][+-]?)?"
+)
+# ... and reads "0x." as zero
+_hexadecimal_point_pattern = re.compile(rb"([+-]?)0[xX]\.")
+
+# Seconds a batch validator has to answer the protocol handshake and to exit
+# once its input is closed, if the validation time is not shorter
+PROTOCOL_TIMEOUT = 10
+# Multiple of the validation time limit a validator may take in wall time
+# before the watchdog kills it, e.g. when it hangs without using CPU time
+WATCHDOG_FACTOR = 2
+MEBIBYTE = 1024 * 1024
+
+USAGE = "Usage: default_validator judge_in judge_ans feedback_file [options] < team_out"
+
+
+class ValidatorResult:
+    def __init__(
+        self,
+        returncode,
+        judge_message="",
+        team_message="",
+        score=None,
+        usage: ResourceUsage = None,
+        limit_exceeded=None,
+    ):
+        self.returncode = returncode
+        self.judge_message = judge_message
+        self.team_message = team_message
+        self.score = score
+        self.usage = usage
+        # Description of the validation limit the validator exceeded, if any
+        self.limit_exceeded = limit_exceeded
+
+
+def exceeded_limit(returncode, running_time, limits: Limits):
+    """Describe the validation limit a validator exceeded, judging from its
+    return code (negative for signals) and running time, or return None."""
+    if returncode == -signal.SIGXFSZ:
+        return f"output limit of {limits.validation_output} MiB"
+    if returncode in (-signal.SIGXCPU, -signal.SIGKILL) or (
+        running_time is not None and running_time > limits.validation_time
+    ):
+        return f"time limit of {limits.validation_time} seconds"
+    return None
+
+
+def read_feedback_file(path):
+    result = None
+    if path.exists():
+        with open(path, errors="replace") as f:
+            result = f.read()
+    return result
+
+
+def parse_float(token: bytes):
+    """Parse token like sscanf("%lf") in the C++ default validator.
+
+    Returns None unless the whole token is a finite floating point number.
+    """
+    try:
+        if match := _decimal_pattern.fullmatch(token):
+            value = float(match[1] + (match[2] or b""))
+        elif match := _hexadecimal_pattern.fullmatch(token):
+            value = float.fromhex((match[1] + (match[2] or b"")).decode())
+        elif match := _hexadecimal_point_pattern.fullmatch(token):
+            value = float(match[1] + b"0")
+        else:
+            return None
+    except OverflowError:
+        return None
+    if math.isinf(value) or math.isnan(value):
+        return None
+    return value
+
+
+def _c_str(token: bytes):
+    # The C++ validator compares and prints tokens as NUL terminated strings
+    return token.split(b"\0", 1)[0]
+
+
+def _text(token: bytes):
+    return _c_str(token).decode("utf8", errors="replace")
+
+
+class _TokenStream:
+    def __init__(self, f):
+        self.file = f
+        self.buffer = b""
+        self.offset = 0
+
+    def _fill(self):
+        if self.offset >= len(self.buffer):
+            self.buffer = self.file.read(CHUNK_SIZE)
+            self.offset = 0
+        return self.offset < len(self.buffer)
+
+    def _read_matching(self, pattern):
+        parts = []
+        while self._fill():
+            end = pattern.match(self.buffer, self.offset).end()
+            parts.append(self.buffer[self.offset:end])
+            self.offset = end
+            if end < len(self.buffer):
+                break
+        return b"".join(parts)
+
+    def buffered(self, n):
+        self._fill()
+        return self.buffer[self.offset:self.offset + n]
+
+    def skip(self, n):
+        self.offset += n
+
+    def peek(self):
+        return self.buffer[self.offset] if self._fill() else -1
+
+    def read(self, n):
+        parts = []
+        while n > 0 and self._fill():
+            part = self.buffer[self.offset:self.offset + n]
+            self.offset += len(part)
+            n -= len(part)
+            parts.append(part)
+        return b"".join(parts)
+
+    def read_space(self):
+        return self._read_matching(_space_pattern)
+
+    def read_token(self):
+        return self._read_matching(_token_pattern) or None
+
+
+def _complete_tokens(data):
+    # Cut off the last token unless it is followed by whitespace
+    return data[:len(data.rstrip(NON_WHITESPACE))]
+
+
+def _float_values(tokens):
+    """Values of the tokens as parse_float reads them, None for the tokens
+    that are not floats."""
+    # float() reads every token made of these characters like parse_float,
+    # if it reads it at all and the value is finite
+    if not b"".join(tokens).translate(None, DECIMAL_CHARACTERS):
+        try:
+            values = list(map(float, tokens))
+        except ValueError:
+            pass
+        else:
+            if all(map(math.isfinite, values)):
+                return values
+    return [parse_float(_c_str(token)) for token in tokens]
+
+
+def _matching_tokens(
+    judge_tokens, team_tokens, float_absolute_tolerance, float_relative_tolerance
+):
+    """Number of leading pairs of tokens that compare_output accepts, given
+    the tokens already lowercased unless the comparison is case sensitive."""
+    count = min(len(judge_tokens), len(team_tokens))
+    judge_tokens = judge_tokens[:count]
+    team_tokens = team_tokens[:count]
+    if float_absolute_tolerance < 0 and float_relative_tolerance < 0:
+        if judge_tokens == team_tokens:
+            return count
+        judge_values = team_values = [None] * count
+    else:
+        judge_values = _float_values(judge_tokens)
+        team_values = _float_values(team_tokens)
+    for i, (judge_token, team_token, judge_value, team_value) in enumerate(
+        zip(judge_tokens, team_tokens, judge_values, team_values)
+    ):
+        if judge_value is not None:
+            if team_value is None:
+                return i
+            difference = abs(judge_value - team_value)
+            if not difference <= float_absolute_tolerance and not (
+                difference <= float_relative_tolerance * abs(judge_value)
+            ):
+                return i
+        elif judge_token != team_token and _c_str(judge_token) != _c_str(team_token):
+            return i
+    return count
+
+
+def _skip_matching(
+    judge,
+    team,
+    case_sensitive,
+    space_change_sensitive,
+    float_absolute_tolerance,
+    float_relative_tolerance,
+):
+    """Skip the longest run of complete tokens in both streams that the token
+    by token comparison accepts, and return the skipped data of both.
+
+    The buffered data is split into tokens once and compared pair by pair.
+    Whitespace is skipped along with the tokens, except that the whitespace
+    after the last token is left to be compared in full once it has been
+    read if changes in whitespace matter.
+    """
+    judge_data = _complete_tokens(judge.buffered(BULK_SIZE))
+    team_data = _complete_tokens(team.buffered(BULK_SIZE))
+    if judge_data == team_data:
+        if space_change_sensitive:
+            judge_data = team_data = judge_data.rstrip(WHITESPACE)
+        judge.skip(len(judge_data))
+        team.skip(len(team_data))
+        return judge_data, team_data
+
+    judge_split = judge_data if case_sensitive else judge_data.lower()
+    team_split = team_data if case_sensitive else team_data.lower()
+    if space_change_sensitive:
+        # Alternating whitespace and tokens, starting and ending with whitespace
+        judge_parts = _split_pattern.split(judge_split)
+        team_parts = _split_pattern.split(team_split)
+        judge_tokens = judge_parts[1::2]
+        team_tokens = team_parts[1::2]
+    else:
+        judge_tokens = judge_split.split()
+        team_tokens = team_split.split()
+    matching = _matching_tokens(
+        judge_tokens, team_tokens, float_absolute_tolerance, float_relative_tolerance
+    )
+    if space_change_sensitive:
+        # The whitespace before every matching token has to be equal too
+        judge_spaces = judge_parts[0:2 * matching:2]
+        team_spaces = team_parts[0:2 * matching:2]
+        if judge_spaces != team_spaces:
+            matching = next(
+                i for i, (c, d) in enumerate(zip(judge_spaces, team_spaces)) if c != d
+            )
+        judge_data = judge_data[:sum(map(len, judge_parts[:2 * matching]))]
+        team_data = team_data[:sum(map(len, team_parts[:2 * matching]))]
+    elif matching:
+        judge_data = judge_data[:_consumed(judge_data, matching)]
+        team_data = team_data[:_consumed(team_data, matching)]
+    else:
+        return b"", b""
+    judge.skip(len(judge_data))
+    team.skip(len(team_data))
+    return judge_data, team_data
+
+
+def _consumed(data, tokens):
+    """Length of the prefix of data containing the given number of tokens and
+    the whitespace following them.
+    """
+    parts = data.split(maxsplit=tokens)
+    return len(data) - (len(parts[tokens]) if len(parts) > tokens else 0)
+
+
+def compare_output(
+    answer_file,
+    output_file,
+    case_sensitive=False,
+    space_change_sensitive=False,
+    float_absolute_tolerance=-1.0,
+    float_relative_tolerance=-1.0,
+):
+    """Compare the binary streams answer_file and output_file token by token.
+
+    Behaves exactly like default_validator.cpp and returns a pair of the exit
+    code it would have used and the contents of its judge message.
+    """
+    judge = _TokenStream(answer_file)
+    team = _TokenStream(output_file)
+    judge_pos = team_pos = 0
+    judge_line = team_line = 1
+    use_floats = float_absolute_tolerance >= 0 or float_relative_tolerance >= 0
+
+    def wrong_answer(message):
+        return EXIT_WA, (
+            f"Wrong answer on line {team_line} of output "
+            f"(corresponding to line {judge_line} in answer file)\n{message}\n"
+        )
+
+    # Tokens are compared in bulk as long as they match, so that the token by
+    # token comparison below only has to report the first difference and
+    # handle tokens that do not fit in the buffer.
+    backoff = 0
+
+    while True:
+        if backoff > 0:
+            backoff -= 1
+        else:
+            judge_data, team_data = _skip_matching(
+                judge,
+                team,
+                case_sensitive,
+                space_change_sensitive,
+                float_absolute_tolerance,
+                float_relative_tolerance,
+            )
+            if judge_data:
+                judge_line += judge_data.count(b"\n")
+                judge_pos += len(judge_data)
+                team_line += team_data.count(b"\n")
+                team_pos += len(team_data)
+                continue
+            backoff = BULK_BACKOFF
+
+        space = judge.read_space()
+        if space_change_sensitive:
+            team_space = team.read(len(space))
+            if team_space != space:
+                mismatch = next(
+                    (i for i, (c, d) in enumerate(zip(space, team_space)) if c != d),
+                    len(team_space),
+                )
+                newlines = space.count(b"\n", 0, mismatch)
+                judge_line += newlines
+                team_line += newlines
+                judge_pos += mismatch
+                team_pos += mismatch
+                d = team_space[mismatch] if mismatch < len(team_space) else -1
+                return wrong_answer(
+                    f"Space change error: got {d} expected {space[mismatch]}"
+                )
+            team_line += space.count(b"\n")
+            team_pos += len(space)
+        judge_line += space.count(b"\n")
+        judge_pos += len(space)
+
+        if space_change_sensitive:
+            d = team.peek()
+            if d != -1 and d in WHITESPACE:
+                return wrong_answer(
+                    f"Space change error: judge out of space, got {d} from team"
+                )
+        else:
+            team_space = team.read_space()
+            team_line += team_space.count(b"\n")
+            team_pos += len(team_space)
+
+        judge_token = judge.read_token()
+        if judge_token is None:
+            break
+
+        team_token = team.read_token()
+        if team_token is None:
+            return wrong_answer(
+                "User EOF while judge had more output\n"
+                f"(Next judge token: {_text(judge_token)})"
+            )
+
+        judge_value = parse_float(_c_str(judge_token)) if use_floats else None
+        if judge_value is not None:
+            team_value = parse_float(_c_str(team_token))
+            if team_value is None:
+                return wrong_answer(f"Expected float, got: {_text(team_token)}")
+            difference = abs(judge_value - team_value)
+            if not difference <= float_absolute_tolerance and not (
+                difference <= float_relative_tolerance * abs(judge_value)
+            ):
+                return wrong_answer(
+                    "Too large difference.\n"
+                    f" Judge: {_text(judge_token)}\n"
+                    f" Team: {_text(team_token)}\n"
+                    " Difference: %e\n (abs tol %e rel tol %e)"
+                    % (
+                        judge_value - team_value,
+                        float_absolute_tolerance,
+                        float_relative_tolerance,
+                    )
+                )
+        elif case_sensitive:
+            if _c_str(judge_token) != _c_str(team_token):
+                return wrong_answer(
+                    "String tokens mismatch\n"
+                    f'Judge: "{_text(judge_token)}"\n'
+                    f'Team: "{_text(team_token)}"'
+                )
+        elif _c_str(judge_token).lower() != _c_str(team_token).lower():
+            return wrong_answer(
+                "String tokens mismatch\n"
+                f'Judge: "{_text(judge_token)}"\n'
+                f'Team: "{_text(team_token)}"'
+            )
+        judge_pos += len(judge_token)
+        team_pos += len(team_token)
+
+    team.read_space()
+    team_token = team.read_token()
+    if team_token is not None:
+        return wrong_answer(f"Trailing output:\n{_text(team_token)}")
+
+    return EXIT_AC, ""
+
+
+def parse_default_validator_flags(flags):
+    options = {}
+    flags = iter(flags)
+    for flag in flags:
+        if flag in ("case_sensitive", "space_change_sensitive"):
+            options[flag] = True
+        elif flag in (
+            "float_absolute_tolerance",
+            "float_relative_tolerance",
+            "float_tolerance",
+        ):
+            value = parse_float(next(flags, "").encode())
+            if value is None:
+                raise ValueError(USAGE)
+            if flag == "float_tolerance":
+                options["float_absolute_tolerance"] = value
+                options["float_relative_tolerance"] = value
+            else:
+                options[flag] = value
+        else:
+            raise ValueError(USAGE)
+    return options
+
+
+class DefaultValidator:
+    """Output validator comparing in process, without spawning a validator."""
+
+    def validate(
+        self, input_filename, answer_filename, output_filename, working_directory, flags
+    ):
+        try:
+            options = parse_default_validator_flags(flags)
+            with open(answer_filename, "rb") as answer_file, open(
+                output_filename, "rb"
+            ) as output_file:
+                returncode, judge_message = compare_output(
+                    answer_file, output_file, **options
+                )
+        except (ValueError, OSError) as error:
+            return ValidatorResult(EXIT_JUDGE_ERROR, f"{error}\n")
+        return ValidatorResult(returncode, judge_message)
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return "default validator"
+
+
+class ProcessValidator:
+    """Output validator program that is run once for every testcase.
+
+    Every run is limited to the validation time, memory and output limits,
+    and killed by a watchdog once it has taken WATCHDOG_FACTOR times the
+    time limit in wall time.
+    """
+
+    def __init__(self, program, limits: Limits = None):
+        self.program = program
+        self.limits = limits or Limits()
+
+    def validate(
+        self, input_filename, answer_filename, output_filename, working_directory, flags
+    ):
+        limits = self.limits
+        feedback_dir = Path(tempfile.mkdtemp(prefix="feedback", dir=working_directory))
+        status, running_time, usage = run_program(
+            self.program,
+            infile=str(output_filename),
+            args=[str(input_filename), str(answer_filename), str(feedback_dir), *flags],
+            timelim=limits.validation_time,
+            memlim=limits.validation_memory,
+            filelim=limits.validation_output * MEBIBYTE,
+            walllim=limits.validation_time * WATCHDOG_FACTOR,
+        )
+        if os.WIFSIGNALED(status):
+            returncode = -os.WTERMSIG(status)
+        else:
+            returncode = os.WEXITSTATUS(status)
+        return ValidatorResult(
+            returncode,
+            read_feedback_file(feedback_dir / "judgemessage.txt"),
+            read_feedback_file(feedback_dir / "teammessage.txt"),
+            read_feedback_file(feedback_dir / "score.txt"),
+            usage,
+            exceeded_limit(returncode, running_time, limits),
+        )
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return str(self.program)
+
+
+class _BatchProcess:
+    def __init__(self, program, limits: Limits):
+        memory_limit = limits.validation_memory * MEBIBYTE
+        if program.should_skip_memory_rlimit():
+            memory_limit = None
+        output_limit = limits.validation_output * MEBIBYTE
+
+        def set_limits():
+            # The CPU time of the process adds up over all testcases, so
+            # requests are limited in wall time instead
+            if memory_limit is not None:
+                try_limit(resource.RLIMIT_AS, memory_limit, resource.RLIM_INFINITY)
+            try_limit(resource.RLIMIT_FSIZE, output_limit, output_limit)
+
+        self.timeout = min(PROTOCOL_TIMEOUT, limits.validation_time)
+        runcmd = program.get_runcmd(memlim=limits.validation_memory)
+        self.process = subprocess.Popen(
+            [*warm_start_command(program, runcmd), BATCH_ARGUMENT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            preexec_fn=set_limits,
+        )
+
+    def handshake(self):
+        try:
+            write_frame(self.process.stdin, {"protocol": PROTOCOL_VERSION})
+        except OSError:
+            return False
+        ready, _, _ = select.select([self.process.stdout], [], [], self.timeout)
+        if not ready:
+            return False
+        try:
+            hello = read_frame(self.process.stdout)
+        except ValueError:
+            return False
+        return hello == {"protocol": PROTOCOL_VERSION}
+
+    def request(self, message, timeout):
+        # The validator serves testcases of every execution slot
+        pin_process(self.process.pid)
+        write_frame(self.process.stdin, message)
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            raise TimeoutError
+        return read_frame(self.process.stdout)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(self.timeout)
+        except subprocess.TimeoutExpired:
+            self.kill()
+
+    def kill(self):
+        self.process.kill()
+        self.process.wait()
+
+
+class BatchValidator:
+    """Output validator program that is started once and validates testcases
+    over the batch protocol of validator_protocol.py.
+
+    Every concurrent caller gets a validator process of its own. Batch mode
+    is declared by the problem, so a validator that does not complete the
+    protocol handshake is killed right away and every testcase gets a judge
+    error, rather than the validator being probed and run once per testcase.
+    Validator processes are limited to the validation memory and output
+    limits, and killed by a watchdog if a testcase takes WATCHDOG_FACTOR
+    times the validation time limit in wall time.
+    """
+
+    def __init__(self, program, limits: Limits = None):
+        self.program = program
+        self.limits = limits or Limits()
+        self.idle = queue.SimpleQueue()
+        self.processes = []
+        # Judge message of every testcase once the handshake failed
+        self.failure = None
+
+    def _start(self):
+        process = _BatchProcess(self.program, self.limits)
+        if not process.handshake():
+            process.kill()
+            self.failure = (
+                f"Output validator {self.program} did not answer the batch protocol "
+                f"handshake within {process.timeout} seconds, "
+                "but the problem declares batch_validator\n"
+            )
+            return None
+        self.processes.append(process)
+        return process
+
+    def validate(
+        self, input_filename, answer_filename, output_filename, working_directory, flags
+    ):
+        if self.failure is not None:
+            return ValidatorResult(EXIT_JUDGE_ERROR, self.failure)
+        try:
+            process = self.idle.get_nowait()
+        except queue.Empty:
+            process = self._start()
+            if process is None:
+                return ValidatorResult(EXIT_JUDGE_ERROR, self.failure)
+
+        start = time.monotonic()
+        try:
+            response = process.request(
+                {
+                    "input": str(Path(input_filename).resolve()),
+                    "answer": str(Path(answer_filename).resolve()),
+                    "output": str(Path(output_filename).resolve()),
+                    "flags": list(flags),
+                },
+                self.limits.validation_time * WATCHDOG_FACTOR,
+            )
+        except TimeoutError:
+            # Killed by the watchdog, the next testcase starts a new one
+            process.kill()
+            return ValidatorResult(
+                EXIT_JUDGE_ERROR,
+                "Batch validator did not answer in time\n",
+                usage=ResourceUsage(wall_time=time.monotonic() - start),
+                limit_exceeded=exceeded_limit(-signal.SIGKILL, None, self.limits),
+            )
+        except (OSError, ValueError):
+            response = None
+        usage = ResourceUsage(wall_time=time.monotonic() - start)
+        if response is None:
+            # The validator died, the next testcase starts a new one
+            process.close()
+            returncode = process.process.returncode
+            return ValidatorResult(
+                EXIT_JUDGE_ERROR,
+                f"Batch validator exited with code {returncode}\n",
+                usage=usage,
+                limit_exceeded=exceeded_limit(returncode, None, self.limits),
+            )
+        self.idle.put(process)
+
+        verdict = response.get("verdict")
+        if verdict == "AC":
+            returncode = EXIT_AC
+        elif verdict == "WA":
+            returncode = EXIT_WA
+        else:
+            return ValidatorResult(
+                EXIT_JUDGE_ERROR, f"Unknown verdict from batch validator: {verdict}\n"
+            )
+        return ValidatorResult(
+            returncode,
+            response.get("judge_message"),
+            response.get("team_message"),
+            response.get("score"),
+            usage,
+        )
+
+    def close(self):
+        for process in self.processes:
+            process.close()
+        self.processes = []
+        self.idle = queue.SimpleQueue()
+
+    def __str__(self):
+        return str(self.program)
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import zipfile
+
+from pathlib import Path
+
+WARM_START_FILENAME = ".warm_start.json"
+# Class data sharing archives of JVM programs, by the hash of their classes
+JVM_ARCHIVE_DIR = Path(__file__).resolve().parent / "build_cache" / "jvm"
+
+PYTHON_COMPILE = (
+    "import py_compile, sys; py_compile.compile(sys.argv[1], sys.argv[2], doraise=True)"
+)
+
+
+class PythonWarmStart:
+    """Runs the main file from bytecode compiled ahead of time.
+
+    The interpreter never caches the bytecode of the script it is started
+    with, only of the modules it imports.
+    """
+
+    def prepare(self, program, argv, timelim=None, memlim=None):
+        mainfile = Path(program.mainfile)
+        bytecode = mainfile.with_name(mainfile.name + "c")
+        subprocess.run(
+            [argv[0], "-c", PYTHON_COMPILE, str(mainfile), str(bytecode)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        return {
+            "mainfile": mainfile.name,
+            "bytecode": bytecode.name,
+        }
+
+    def command(self, program, record, argv):
+        path = Path(program.path)
+        mainfile = str(path / record["mainfile"])
+        bytecode = str(path / record["bytecode"])
+        return [bytecode if arg == mainfile else arg for arg in argv]
+
+
+class JavaWarmStart:
+    """Starts the JVM from an application class data sharing archive.
+
+    The compiled classes are packed into a jar, since only classes from jars
+    can be archived, and the classes loaded by a training run on empty input
+    are dumped into the archive. The archive only matches the absolute path
+    of the jar it was dumped with, so both are kept in a directory of
+    JVM_ARCHIVE_DIR named after the hash of the classes and the java
+    command, where they stay valid when the program is restored from the
+    build cache into another directory.
+
+    The training run executes the submission, so it runs in a scratch
+    directory within the compile limits, and is killed along with any
+    processes it starts when it runs out of time.
+    """
+
+    def java_command(self, argv):
+        """Return the java options, the class path and the main class."""
+        classpath_index = argv.index("-cp") + 1
+        return argv[1:classpath_index - 1], [], argv[-1]
+
+    def java(self, argv):
+        return argv[0]
+
+    def directory(self, program, argv):
+        options, _, mainclass = self.java_command(argv)
+        digest = hashlib.sha256()
+        # Not the class path, which is the program's temporary directory
+        digest.update("\0".join([self.java(argv), *options, mainclass]).encode())
+        path = Path(program.path)
+        for class_file in sorted(path.rglob("*.class")):
+            digest.update(str(class_file.relative_to(path)).encode())
+            digest.update(b"\0")
+            digest.update(class_file.read_bytes())
+        return JVM_ARCHIVE_DIR / digest.hexdigest()
+
+    def prepare(self, program, argv, timelim=None, memlim=None):
+        directory = self.directory(program, argv)
+        if (directory / "warm_start.jsa").is_file():
+            return {"directory": str(directory)}
+        # Fails if another grader is building the same archive, or did not
+        # finish building it, in which case the program starts as usual
+        directory.mkdir(parents=True)
+        try:
+            self._build(program, argv, directory, timelim, memlim)
+        except BaseException:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return {"directory": str(directory)}
+
+    def _build(self, program, argv, directory, timelim, memlim):
+        # execution imports this module
+        from execution import run_in_session
+
+        jar = directory / "warm_start.jar"
+        archive = directory / "warm_start.jsa"
+        deadline = None if timelim is None else time.monotonic() + timelim
+
+        def remaining():
+            if deadline is None:
+                return None
+            return max(0.0, deadline - time.monotonic())
+
+        path = Path(program.path)
+        with zipfile.ZipFile(jar, "w") as f:
+            for class_file in sorted(path.rglob("*.class")):
+                f.write(class_file, class_file.relative_to(path))
+
+        options, classpath, mainclass = self.java_command(argv)
+        classpath = os.pathsep.join([str(jar), *classpath])
+        class_list = directory / "warm_start.classlist"
+        scratch = tempfile.mkdtemp(prefix="warm_start")
+        try:
+            run_in_session(
+                [
+                    self.java(argv),
+                    *options,
+                    "-Xshare:off",
+                    f"-XX:DumpLoadedClassList={class_list}",
+                    "-cp",
+                    classpath,
+                    mainclass,
+                ],
+                remaining(),
+                memlim,
+                cwd=scratch,
+                capture_output=False,
+            )
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+        returncode, _ = run_in_session(
+            [
+                self.java(argv),
+                *options,
+                "-Xshare:dump",
+                f"-XX:SharedClassListFile={class_list}",
+                f"-XX:SharedArchiveFile={archive}.tmp",
+                "-cp",
+                classpath,
+            ],
+            remaining(),
+            memlim,
+            cwd=directory,
+            capture_output=False,
+        )
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, "java -Xshare:dump")
+        os.rename(f"{archive}.tmp", archive)
+
+    def command(self, program, record, argv):
+        if "directory" not in record:
+            return argv
+        directory = Path(record["directory"])
+        if not (directory / "warm_start.jsa").is_file():
+            return argv
+        options, classpath, mainclass = self.java_command(argv)
+        return [
+            self.java(argv),
+            *options,
+            f"-XX:SharedArchiveFile={directory / 'warm_start.jsa'}",
+            "-Xshare:auto",
+            "-cp",
+            os.pathsep.join([str(directory / "warm_start.jar"), *classpath]),
+            mainclass,
+        ]
+
+
+class KotlinWarmStart(JavaWarmStart):
+    """Starts Kotlin programs directly on the JVM, with the Kotlin standard
+    and reflection libraries on the class path like the kotlin launcher puts
+    them, instead of through the launcher, whose class loader keeps classes
+    out of class data sharing archives."""
+
+    def libraries(self, argv):
+        kotlin_home = Path(argv[0]).resolve().parent.parent
+        standard_library = kotlin_home / "lib" / "kotlin-stdlib.jar"
+        if not standard_library.is_file():
+            raise FileNotFoundError(standard_library)
+        libraries = [str(standard_library)]
+        reflection = kotlin_home / "lib" / "kotlin-reflect.jar"
+        if reflection.is_file():
+            libraries.append(str(reflection))
+        return libraries
+
+    def java_command(self, argv):
+        classpath_index = argv.index("-cp") + 1
+        options = [
+            option[2:] if option.startswith("-J") else option
+            for option in argv[1:classpath_index - 1]
+        ]
+        return options, self.libraries(argv), argv[-1]
+
+    def java(self, argv):
+        return "java"
+
+
+WARM_STARTS = {
+    "python2": PythonWarmStart(),
+    "python2_with_shebang": PythonWarmStart(),
+    "python3": PythonWarmStart(),
+    "pypy": PythonWarmStart(),
+    "pypy3": PythonWarmStart(),
+}
+# Only used with the jvm_warm_start option
+JVM_WARM_STARTS = {
+    "java": JavaWarmStart(),
+    "kotlin": KotlinWarmStart(),
+}
+
+
+def _warm_start(program, jvm=True):
+    language = getattr(program, "language", None)
+    if language is None:
+        return None
+    if jvm and language.lang_id in JVM_WARM_STARTS:
+        return JVM_WARM_STARTS[language.lang_id]
+    return WARM_STARTS.get(language.lang_id)
+
+
+def _load_record(program):
+    try:
+        with open(Path(program.path) / WARM_START_FILENAME) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def prepare_warm_start(program, timelim=None, memlim=None, jvm=False):
+    """Build the warm start artifacts of a compiled program.
+
+    Does nothing if the program's language has no warm start or its
+    artifacts are still valid. A program whose artifacts cannot be built just
+    starts as usual. Java and Kotlin programs only get them with jvm set,
+    within timelim seconds and memlim MiB like their compilation.
+    """
+    warm_start = _warm_start(program, jvm)
+    if warm_start is None:
+        return False
+    argv = program.get_runcmd()
+    if program.should_skip_memory_rlimit():
+        memlim = None
+    record = _load_record(program)
+    if record is not None and warm_start.command(program, record, argv) != argv:
+        return True
+    try:
+        record = warm_start.prepare(program, argv, timelim, memlim)
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return False
+    with open(Path(program.path) / WARM_START_FILENAME, "w") as f:
+        json.dump(record, f)
+    return True
+
+
+def warm_start_command(program, argv):
+    """Return the command starting the program from its warm start
+    artifacts, or argv if it has none."""
+    warm_start = _warm_start(program)
+    if warm_start is None:
+        return argv
+    record = _load_record(program)
+    if record is None:
+        return argv
+    return warm_start.command(program, record, argv)